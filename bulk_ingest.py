@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from elastic_transport import ConnectionError, ConnectionTimeout
+from elasticsearch import ApiError, helpers
+
+load_dotenv()
+
+# Bulk requests in flight at once (each one keeps inference busy on the ML nodes)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+# Chunk size starts small and adapts so that one request takes about BULK_TARGET_SECONDS
+BULK_INITIAL_DOCS = int(os.getenv("BULK_INITIAL_DOCS", "10"))
+BULK_MIN_DOCS = int(os.getenv("BULK_MIN_DOCS", "1"))
+BULK_MAX_DOCS = int(os.getenv("BULK_MAX_DOCS", "500"))
+BULK_TARGET_SECONDS = float(os.getenv("BULK_TARGET_SECONDS", "10"))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES", str(5 * 1024 * 1024)))
+# Items rejected with 429 (es_rejected_execution_exception) are retried with exponential backoff
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "5"))
+BULK_INITIAL_BACKOFF = float(os.getenv("BULK_INITIAL_BACKOFF", "2"))
+BULK_MAX_BACKOFF = float(os.getenv("BULK_MAX_BACKOFF", "120"))
+
+# Index settings applied while loading; the index's own values are read first and put back afterwards.
+# "rebuild" is for a new index version that takes no traffic yet; "live" for writes
+# into the index being searched, so it keeps its replicas and stays fairly fresh.
+INDEX_PROFILES = {
+    "rebuild": {
+        "load": {"refresh_interval": "-1", "number_of_replicas": 0,
+                 "translog.durability": "async", "translog.sync_interval": "30s"},
+        "force_merge_segments": 1,
+    },
+    "live": {
+        "load": {"refresh_interval": "30s", "translog.durability": "async", "translog.sync_interval": "30s"},
+        "force_merge_segments": None,
+    },
+}
+# Force a profile for every load (otherwise the caller picks one)
+INDEX_PROFILE = os.getenv("INDEX_PROFILE")
+
+
+class ChunkSizer:
+    """Picks the number of documents per bulk request from the observed per-document latency."""
+
+    def __init__(self, initial=BULK_INITIAL_DOCS, minimum=BULK_MIN_DOCS, maximum=BULK_MAX_DOCS,
+                 target_seconds=BULK_TARGET_SECONDS):
+        self.docs = max(minimum, min(maximum, initial))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self._lock = threading.Lock()
+
+    def observe(self, docs, seconds):
+        if docs <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            ideal = self.target_seconds / (seconds / docs)
+            # Smooth and grow at most 2x per step so one fast chunk does not overshoot
+            new = min(0.5 * self.docs + 0.5 * ideal, 2 * self.docs)
+            self.docs = int(max(self.minimum, min(self.maximum, new)))
+
+    def shrink(self):
+        with self._lock:
+            self.docs = max(self.minimum, self.docs // 2)
+
+
+class IngestStats:
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.ok = 0
+        self.failed = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.es_seconds = 0.0
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def add(self, docs, size, seconds, errors):
+        with self._lock:
+            self.chunks += 1
+            self.ok += docs - len(errors)
+            self.failed += len(errors)
+            self.bytes += size
+            self.es_seconds += seconds
+            self.errors.extend(errors[:max(0, 10 - len(self.errors))])
+
+    def progress(self, chunk_docs):
+        elapsed = time.perf_counter() - self.started
+        print(f" ~ {self.ok + self.failed} {self.label} sent ({self.ok / elapsed:.1f} docs/s), "
+              f"next chunk {chunk_docs} docs")
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        docs = self.ok + self.failed
+        per_doc = self.es_seconds / docs * 1000 if docs else 0.0
+        print(f"Bulk ingest: {self.ok} {self.label} indexed, {self.failed} failed in {elapsed:.1f}s "
+              f"({self.ok / elapsed:.1f} docs/s, {self.bytes / elapsed / 1024 / 1024:.2f} MB/s, "
+              f"{self.chunks} requests, {per_doc:.0f} ms/doc in Elasticsearch incl. inference)")
+        for error in self.errors[:3]:
+            print(f" Sample error: {error}")
+
+
+def action_size(action):
+    return len(json.dumps(action.get("_source", {}), ensure_ascii=False).encode("utf-8")) + 100
+
+
+def iter_chunks(actions, sizer, max_bytes=BULK_MAX_CHUNK_BYTES):
+    """Group actions into chunks bounded by the current adaptive doc count and by bytes."""
+    chunk, size = [], 0
+    for action in actions:
+        action_bytes = action_size(action)
+        if chunk and (len(chunk) >= sizer.docs or size + action_bytes > max_bytes):
+            yield chunk, size
+            chunk, size = [], 0
+        chunk.append(action)
+        size += action_bytes
+    if chunk:
+        yield chunk, size
+
+
+def is_error(item):
+    """A failed bulk item; deleting a document that is already gone counts as done."""
+    (op_type, info), = item.items()
+    return not (op_type == "delete" and info.get("status") == 404)
+
+
+def send_chunk(es, chunk, sizer):
+    """Index one chunk; returns (seconds, errors).
+
+    `streaming_bulk` retries only the items rejected with 429. A request that
+    times out (usually inference on a too large chunk) is split in half and retried.
+    """
+    start = time.perf_counter()
+    try:
+        errors = [item for ok, item in helpers.streaming_bulk(
+            es, chunk, chunk_size=len(chunk), max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+            raise_on_error=False, raise_on_exception=False, yield_ok=False,
+            max_retries=BULK_MAX_RETRIES, initial_backoff=BULK_INITIAL_BACKOFF, max_backoff=BULK_MAX_BACKOFF
+        ) if not ok and is_error(item)]
+    except (ConnectionTimeout, ConnectionError) as e:
+        if len(chunk) == 1:
+            op_type = chunk[0].get("_op_type", "index")
+            return time.perf_counter() - start, [{op_type: {"_id": chunk[0].get("_id"), "error": str(e)}}]
+        sizer.shrink()
+        print(f" ? Bulk request of {len(chunk)} docs failed ({e.__class__.__name__}), splitting")
+        half = len(chunk) // 2
+        _, first = send_chunk(es, chunk[:half], sizer)
+        _, second = send_chunk(es, chunk[half:], sizer)
+        return time.perf_counter() - start, first + second
+    seconds = time.perf_counter() - start
+    sizer.observe(len(chunk), seconds)
+    return seconds, errors
+
+
+def acked_ids(chunk, errors):
+    """`_id`s of the chunk's actions that did not fail."""
+    failed = {info.get("_id") for error in errors for info in error.values()}
+    return [action["_id"] for action in chunk if action.get("_id") not in failed]
+
+
+def ingest(es, actions, label="documents", concurrency=BULK_CONCURRENCY, sizer=None, on_ack=None):
+    """Stream `actions` (any iterable) into Elasticsearch with adaptive, concurrent bulk requests.
+
+    At most `concurrency` chunks are in memory/in flight at a time. `on_ack(ids)`
+    is called with the `_id`s of each finished chunk that were indexed. Returns
+    the IngestStats after printing the throughput report.
+    """
+    sizer = sizer or ChunkSizer()
+    stats = IngestStats(label)
+
+    in_flight = {}
+
+    def finish(futures):
+        for future in futures:
+            chunk, size = in_flight.pop(future)
+            seconds, errors = future.result()
+            stats.add(len(chunk), size, seconds, errors)
+            if on_ack:
+                on_ack(acked_ids(chunk, errors))
+        stats.progress(sizer.docs)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for chunk, size in iter_chunks(actions, sizer):
+            if len(in_flight) >= concurrency:
+                finish(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            in_flight[pool.submit(send_chunk, es, chunk, sizer)] = (chunk, size)
+        if in_flight:
+            finish(wait(in_flight).done)
+
+    stats.report()
+    return stats
+
+
+def put_index_settings(es, index, values):
+    try:
+        es.indices.put_settings(index=index, settings={f"index.{k}": v for k, v in values.items()})
+    except ApiError as e:
+        # e.g. settings that a managed/serverless deployment does not allow
+        print(f" ? Could not apply settings {values} to {index}: {e}")
+
+
+def current_index_settings(es, index, keys):
+    """Explicit values of `keys` per concrete index behind `index`; None for keys left at their default."""
+    resp = es.indices.get_settings(index=index, flat_settings=True)
+    return {name: {key: body["settings"].get(f"index.{key}") for key in keys} for name, body in resp.items()}
+
+
+@contextmanager
+def load_settings(es, index, profile):
+    """Apply the profile's load-time settings around a bulk load.
+
+    Yields a dict in which the caller records `failed` items. Afterwards each
+    setting is put back to the value it had before (or reset to its default)
+    and the index is refreshed once. Only a load without an exception and
+    without failed items is force-merged, if the profile asks for it.
+    """
+    name = INDEX_PROFILE or profile
+    config = INDEX_PROFILES[name]
+    load = {"failed": 0}
+    try:
+        previous = current_index_settings(es, index, config["load"])
+    except ApiError as e:
+        # Without the current values they could not be put back, so the load runs with them unchanged
+        print(f" ? Could not read settings of {index}, loading without the '{name}' settings: {e}")
+        previous = {}
+    if previous:
+        print(f"Applying '{name}' load settings to {index}")
+        put_index_settings(es, index, config["load"])
+    try:
+        yield load
+    finally:
+        for concrete, values in previous.items():
+            put_index_settings(es, concrete, values)
+        es.indices.refresh(index=index)
+    segments = config.get("force_merge_segments")
+    if segments and load["failed"]:
+        print(f"Not force-merging {index}: {load['failed']} items failed")
+    elif segments:
+        start = time.perf_counter()
+        es.indices.forcemerge(index=index, max_num_segments=segments)
+        print(f"Force-merged {index} to {segments} segment(s) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+from collections import defaultdict
+
+# Journals of completed work units, one file per script
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", ".checkpoints")
+
+
+class CheckpointJournal:
+    """Append-only JSONL journal of work units (a subject, a noise seed, a PDF file).
+
+    A unit is recorded once it was fully fetched (`fetched`) and every document
+    it produced was acknowledged by Elasticsearch (`ack`). With `resume=True`
+    the existing journal is loaded and `is_done` lets fetchers skip those units;
+    otherwise the journal starts empty.
+    """
+
+    def __init__(self, name, resume=False):
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        self.path = os.path.join(CHECKPOINT_DIR, f"{name}.jsonl")
+        self.done = {}
+        self.meta = {}
+        if resume and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from a crash
+                    if "meta" in entry:
+                        self.meta.update(entry["meta"])
+                    else:
+                        self.done[entry["unit"]] = entry["ids"]
+            print(f"Resuming: {len(self.done)} units already indexed ({self.path})")
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = defaultdict(list)
+        self._fetched = set()
+        self._units_by_id = defaultdict(set)
+        self._acked = set()
+
+    def is_done(self, unit):
+        return unit in self.done
+
+    def unit_ids(self, unit):
+        return self.done.get(unit, [])
+
+    def done_ids(self):
+        return {doc_id for ids in self.done.values() for doc_id in ids}
+
+    def set_meta(self, **values):
+        self.meta.update(values)
+        self._write({"meta": values})
+
+    def add(self, unit, doc_id, record=True):
+        """Register a document of `unit` before it is handed to the bulk pipeline.
+
+        `record=False` is for a document the unit deletes: it must be acknowledged
+        before the unit completes, but is not listed in `unit_ids`.
+        """
+        with self._lock:
+            if record:
+                self._ids[unit].append(doc_id)
+            pending = self._pending.setdefault(unit, set())
+            # The same article can come from two units; it is only sent (and acknowledged) once
+            if doc_id not in self._acked:
+                pending.add(doc_id)
+                self._units_by_id[doc_id].add(unit)
+
+    def fetched(self, unit):
+        """All documents of `unit` were registered; it completes once they are acknowledged."""
+        with self._lock:
+            self._fetched.add(unit)
+            self._pending.setdefault(unit, set())
+            self._complete_if_done(unit)
+
+    def ack(self, doc_ids):
+        """Documents that Elasticsearch indexed (or that needed no write)."""
+        with self._lock:
+            for doc_id in doc_ids:
+                self._acked.add(doc_id)
+                for unit in self._units_by_id.pop(doc_id, ()):
+                    self._pending[unit].discard(doc_id)
+                    self._complete_if_done(unit)
+
+    def _complete_if_done(self, unit):
+        if unit in self._fetched and not self._pending[unit]:
+            self.done[unit] = self._ids.pop(unit, [])
+            del self._pending[unit]
+            self._fetched.discard(unit)
+            self._write({"unit": unit, "ids": self.done[unit]})
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
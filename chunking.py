@@ -0,0 +1,84 @@
+import os
+import re
+
+# Passage size for full-document indexing; E5 handles ~512 tokens, so keep passages well below that
+CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", "1500"))
+# Characters repeated from the end of one passage at the start of the next
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?؟。])\s+")
+
+
+def paragraphs(text):
+    return [p.strip() for p in _PARAGRAPH_BREAK.split(text) if p.strip()]
+
+
+def split_long(paragraph, max_chars):
+    """Split an oversized paragraph at sentence ends, and at whitespace as a last resort."""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_END.split(paragraph):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def overlap_tail(text, overlap):
+    """The last `overlap` characters of a passage, starting at a word boundary."""
+    if overlap <= 0 or len(text) <= overlap:
+        return text if overlap > 0 else ""
+    tail = text[-overlap:]
+    space = tail.find(" ")
+    return tail[space + 1:] if space >= 0 else tail
+
+
+def chunk_pages(pages, max_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Split [(page_number, text), ...] into overlapping passages along paragraph boundaries.
+
+    Returns [(page_number, passage), ...] where page_number is the page the
+    passage starts on (None for sources without pages). A passage never exceeds
+    `max_chars` plus the overlap carried over from the previous one.
+    """
+    chunks = []
+    current, current_page = "", None
+    for page_number, text in pages:
+        for paragraph in paragraphs(text):
+            for piece in (split_long(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph]):
+                if current and len(current) + 2 + len(piece) > max_chars + overlap:
+                    chunks.append((current_page, current))
+                    tail = overlap_tail(current, overlap)
+                    current = f"{tail}\n\n{piece}" if tail else piece
+                    current_page = page_number
+                else:
+                    current = f"{current}\n\n{piece}" if current else piece
+                    current_page = page_number if current_page is None else current_page
+    if current:
+        chunks.append((current_page, current))
+    return chunks
+
+
+def chunk_id(parent_id, number):
+    """`_id` of a passage; the first one keeps the parent's id."""
+    return parent_id if number == 0 else f"{parent_id}-{number}"
+
+
+def chunk_document(doc, parent_id, pages, max_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Child documents for `doc`: one per passage, each with `parent_id`, `page` and `chunk`."""
+    children = []
+    for number, (page, passage) in enumerate(chunk_pages(pages, max_chars, overlap)):
+        child = {**doc, "content": passage, "parent_id": parent_id, "chunk": number}
+        if page is not None:
+            child["page"] = page
+        children.append(child)
+    return children
@@ -1,9 +1,13 @@
 import os
+import argparse
 import wikipediaapi
 import torch
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch
 from sentence_transformers import SentenceTransformer
+from wiki_cache import WikiCache
+from bulk_ingest import ingest
+from embedding_store import EmbeddingStore
 
 # Load environment variables
 load_dotenv()
@@ -18,12 +22,44 @@ if ELASTIC_CLOUD_ID:
 else:
     client = Elasticsearch(ELASTIC_URL, api_key=ELASTIC_API_KEY)
 
+# Local embedding settings
+# Texts per forward pass
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Documents buffered and sorted by length before encoding, so each batch pads to similar lengths
+EMBED_BUCKET_SIZE = int(os.getenv("EMBED_BUCKET_SIZE", "1024"))
+# Encoder processes; 0 or 1 encodes in this process, more starts a pool that splits the cores
+EMBED_PROCESSES = int(os.getenv("EMBED_PROCESSES", "0"))
+# Intra-op threads of this process (the pool divides them among its workers)
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", str(os.cpu_count() or 1)))
+
+torch.set_num_threads(TORCH_THREADS)
+
 # Use a local multilingual model
 MODEL_NAME = "intfloat/multilingual-e5-small"
 model = SentenceTransformer(MODEL_NAME)
+# Vectors of texts encoded by earlier runs are read from disk instead of encoded again
+store = EmbeddingStore(MODEL_NAME, model.get_sentence_embedding_dimension())
 
 INDEX_NAME = "local-multilingual-demo"
 
+# HNSW variant of content_vector: hnsw (float), int8_hnsw (4x smaller), int4_hnsw (8x), bbq_hnsw (32x).
+# Unset keeps the cluster default. Changing it needs --reindex.
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE")
+VECTOR_INDEX_TYPES = ("hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "100"))
+# Candidates per shard for kNN search; same setting and default as the search app's knn leg
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "100"))
+# Quantized indices: fetch k * oversample candidates and rescore them with the float vectors (unset = off)
+KNN_OVERSAMPLE = float(os.getenv("KNN_OVERSAMPLE", "0")) or None
+
+def vector_index_options(index_type=VECTOR_INDEX_TYPE):
+    if not index_type:
+        return {}
+    if index_type not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"VECTOR_INDEX_TYPE must be one of {', '.join(VECTOR_INDEX_TYPES)}, not {index_type!r}")
+    return {"index_options": {"type": index_type, "m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}}
+
 def create_index():
     if client.indices.exists(index=INDEX_NAME):
         print(f"Index {INDEX_NAME} already exists. Skipping creation.")
@@ -41,13 +77,14 @@ def create_index():
                     "type": "dense_vector",
                     "dims": 384, # E5-small dimension
                     "index": True,
-                    "similarity": "cosine"
+                    "similarity": "cosine",
+                    **vector_index_options()
                 }
             }
         }
     }
     client.indices.create(index=INDEX_NAME, body=mapping)
-    print(f"Created index: {INDEX_NAME}")
+    print(f"Created index: {INDEX_NAME} (vectors: {VECTOR_INDEX_TYPE or 'cluster default'})")
     return True
 
 def fetch_data():
@@ -62,50 +99,88 @@ def fetch_data():
         "ירושלים": {"category": "Geography", "rating": 4},
         "מדע": {"category": "Science", "rating": 5}
     }
+    cache = WikiCache()
     pages = []
     for t, meta in wiki_items.items():
-        p = wiki.page(t)
-        if p.exists():
+        p = cache.page(wiki, t)
+        if p:
             pages.append({
-                "title": p.title, 
-                "url": p.fullurl, 
-                "content": p.summary,
+                "title": p["title"], 
+                "url": p["fullurl"], 
+                "content": p["summary"],
                 "category": meta["category"],
                 "rating": meta["rating"]
             })
-            print(f" - Fetched: {p.title} (Category: {meta['category']}, Rating: {meta['rating']})")
+            print(f" - Fetched: {p['title']} (Category: {meta['category']}, Rating: {meta['rating']})")
+    cache.report()
     return pages
 
+def start_encoder_pool(processes=EMBED_PROCESSES):
+    """A multi-process encoding pool on the CPU, or None to encode in this process."""
+    if processes <= 1:
+        return None
+    # Spawned workers read this at startup; without it every worker would use all cores
+    os.environ["OMP_NUM_THREADS"] = str(max(1, TORCH_THREADS // processes))
+    print(f"Starting {processes} encoder processes ({os.environ['OMP_NUM_THREADS']} threads each)")
+    return model.start_multi_process_pool(target_devices=["cpu"] * processes)
+
+def encode_passages(texts, pool=None):
+    # E5 models require 'passage: ' prefix for indexing
+    passages = [f"passage: {t}" for t in texts]
+    if pool:
+        return store.encode(passages, lambda missing: model.encode(
+            missing, pool=pool, batch_size=EMBED_BATCH_SIZE, chunk_size=EMBED_BATCH_SIZE * 4))
+    return store.encode(passages, lambda missing: model.encode(missing, batch_size=EMBED_BATCH_SIZE))
+
+def embedded_actions(pages, pool=None, bucket_size=EMBED_BUCKET_SIZE):
+    """Bulk actions with local embeddings, encoded one length-sorted bucket of pages at a time."""
+    pages = iter(pages)
+    while True:
+        bucket = [page for _, page in zip(range(bucket_size), pages)]
+        if not bucket:
+            return
+        bucket.sort(key=lambda page: len(page["content"]))
+        vectors = encode_passages([page["content"] for page in bucket], pool)
+        for page, vector in zip(bucket, vectors):
+            yield {
+                "_index": INDEX_NAME,
+                # The passage's store key: indexing the same passage again overwrites it
+                "_id": store.key(f"passage: {page['content']}").hex(),
+                "_source": {
+                    **page,
+                    "content_vector": vector.tolist()
+                }
+            }
+
 def index_data(pages):
+    """Embed `pages` (any iterable) locally and stream them into bulk indexing while later buckets are encoded."""
     print("Generating local embeddings and indexing...")
-    actions = []
-    for page in pages:
-        # E5 models require 'passage: ' prefix for indexing
-        vector = model.encode(f"passage: {page['content']}").tolist()
-        actions.append({
-            "_index": INDEX_NAME,
-            "_source": {
-                **page,
-                "content_vector": vector
-            }
-        })
-    helpers.bulk(client, actions)
+    pool = start_encoder_pool()
+    try:
+        ingest(client, embedded_actions(pages, pool), label="passages")
+    finally:
+        if pool:
+            model.stop_multi_process_pool(pool)
     client.indices.refresh(index=INDEX_NAME)
     print("Success!")
 
 def search(query_text):
     print(f"\nSearching for: '{query_text}'")
     # E5 models require 'query: ' prefix for searching
-    query_vector = model.encode(f"query: {query_text}").tolist()
+    query_vector = store.encode([f"query: {query_text}"], model.encode)[0].tolist()
     
+    knn = {
+        "field": "content_vector",
+        "query_vector": query_vector,
+        "k": 3,
+        "num_candidates": max(KNN_NUM_CANDIDATES, 3)
+    }
+    if KNN_OVERSAMPLE:
+        knn["rescore_vector"] = {"oversample": KNN_OVERSAMPLE}
+
     response = client.search(
         index=INDEX_NAME,
-        knn={
-            "field": "content_vector",
-            "query_vector": query_vector,
-            "k": 3,
-            "num_candidates": 10
-        },
+        knn=knn,
         _source=["title", "url"]
     )
     
@@ -113,6 +188,17 @@ def search(query_text):
         print(f" - {hit['_source']['title']} (Score: {hit['_score']:.4f})")
 
 def main():
+    parser = argparse.ArgumentParser(description="Index Hebrew Wikipedia pages with local E5 embeddings and run test queries.")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Delete and rebuild the index (stored vectors are reused, nothing is re-encoded)")
+    parser.add_argument("--compact-store", action="store_true",
+                        help="Afterwards drop stored vectors this run did not use")
+    args = parser.parse_args()
+
+    if args.reindex and client.indices.exists(index=INDEX_NAME):
+        client.indices.delete(index=INDEX_NAME)
+        print(f"Deleted index: {INDEX_NAME}")
+
     # Check if we need to create and index
     if not client.indices.exists(index=INDEX_NAME):
         create_index()
@@ -126,5 +212,9 @@ def main():
     search("מדינת ישראל")
     search("Modern science and research")
 
+    store.report()
+    if args.compact_store:
+        store.compact()
+
 if __name__ == "__main__":
     main()
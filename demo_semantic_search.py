@@ -2,6 +2,7 @@ import os
 import wikipediaapi
 from dotenv import load_dotenv
 from elasticsearch import Elasticsearch, helpers
+from wiki_cache import WikiCache
 
 # Load environment variables
 load_dotenv()
@@ -75,18 +76,20 @@ def fetch_wikipedia_pages():
         "ירושלים": {"category": "Geography", "rating": 4},
         "מדע": {"category": "Science", "rating": 5}
     }
+    cache = WikiCache()
     pages = []
     for title, meta in wiki_items.items():
-        page = wiki.page(title)
-        if page.exists():
-            print(f" - Fetched: {page.title} (Category: {meta['category']}, Rating: {meta['rating']})")
+        page = cache.page(wiki, title)
+        if page:
+            print(f" - Fetched: {page['title']} (Category: {meta['category']}, Rating: {meta['rating']})")
             pages.append({
-                "title": page.title,
-                "url": page.fullurl,
-                "content": page.summary,
+                "title": page["title"],
+                "url": page["fullurl"],
+                "content": page["summary"],
                 "category": meta["category"],
                 "rating": meta["rating"]
             })
+    cache.report()
     return pages
 
 def index_data(pages):
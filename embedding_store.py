@@ -0,0 +1,130 @@
+import os
+import re
+import hashlib
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Persistent store of local embeddings, one matrix per model
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", ".embeddings")
+# float32 keeps vectors bit-identical to a fresh encode; float16 halves the disk and page cache footprint
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")
+
+KEY_BYTES = 32 # sha256 digest
+
+
+class EmbeddingStore:
+    """Disk-backed embeddings keyed by sha256 of model name and the exact (prefixed) input text.
+
+    Two append-only files per model: `<model>.<dtype>` holds the vectors as a
+    raw row-major matrix read through a memory map, `<model>.keys` the 32-byte
+    key of each row in the same order. A row only counts once its key is
+    written, so a torn append is ignored on the next load. `compact()` rewrites
+    both files with the rows to keep.
+    """
+
+    def __init__(self, model_name, dims, directory=EMBEDDING_STORE_DIR, dtype=EMBEDDING_STORE_DTYPE):
+        self.model_name = model_name
+        self.dims = dims
+        self.dtype = np.dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, re.sub(r"[^\w.-]", "_", model_name))
+        self.matrix_path = f"{base}.{self.dtype.name}"
+        self.keys_path = f"{base}.keys"
+        self.hits = 0
+        self.encoded = 0
+        self.used = set()
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        keys = b""
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                keys = f.read()
+        matrix_rows = os.path.getsize(self.matrix_path) // self.row_bytes if os.path.exists(self.matrix_path) else 0
+        rows = min(len(keys) // KEY_BYTES, matrix_rows)
+        self.rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+        self.count = rows
+        # Drop a torn tail so the next append starts on a row boundary
+        for path, size in ((self.keys_path, rows * KEY_BYTES), (self.matrix_path, rows * self.row_bytes)):
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        self._matrix = None
+
+    @property
+    def row_bytes(self):
+        return self.dims * self.dtype.itemsize
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def _view(self):
+        """Memory map of all rows; re-mapped after appends grew the file."""
+        if self._matrix is None or len(self._matrix) < self.count:
+            self._matrix = np.memmap(self.matrix_path, dtype=self.dtype, mode="r", shape=(self.count, self.dims))
+        return self._matrix
+
+    def _append(self, keys, vectors):
+        with open(self.matrix_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        with open(self.keys_path, "ab") as f:
+            f.write(b"".join(keys))
+        for key in keys:
+            self.rows[key] = self.count
+            self.count += 1
+
+    def encode(self, texts, encode_fn):
+        """Vectors for `texts` as a float32 array; only texts not stored yet go through `encode_fn`.
+
+        `texts` must already carry the model's prefix ("passage: ", "query: "),
+        since that is part of the key. `encode_fn(list_of_texts)` returns one vector per text.
+        """
+        keys = [self.key(t) for t in texts]
+        with self._lock:
+            self.used.update(keys)
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self.rows and key not in missing:
+                    missing[key] = text
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            with self._lock:
+                self._append(list(missing), vectors)
+        if not texts:
+            return np.empty((0, self.dims), dtype=np.float32)
+        with self._lock:
+            self.encoded += len(missing)
+            self.hits += len(texts) - len(missing)
+            matrix = self._view()
+            return np.asarray(matrix[[self.rows[key] for key in keys]], dtype=np.float32)
+
+    def compact(self, keep=None):
+        """Rewrite the store with only the rows in `keep` (default: the ones used by this process)."""
+        keep = self.used if keep is None else keep
+        with self._lock:
+            rows = sorted(row for key, row in self.rows.items() if key in keep)
+            keys = {row: key for key, row in self.rows.items()}
+            matrix = self._view() if self.count else None
+            with open(f"{self.matrix_path}.tmp", "wb") as f:
+                if rows:
+                    f.write(np.ascontiguousarray(matrix[rows]).tobytes())
+            with open(f"{self.keys_path}.tmp", "wb") as f:
+                f.write(b"".join(keys[row] for row in rows))
+            # Empty the keys first: a crash between the two renames leaves an empty store, never shifted rows
+            open(self.keys_path, "wb").close()
+            # Release the map before replacing the file under it (required on Windows)
+            matrix = self._matrix = None
+            os.replace(f"{self.matrix_path}.tmp", self.matrix_path)
+            os.replace(f"{self.keys_path}.tmp", self.keys_path)
+            dropped = self.count - len(rows)
+            self._load()
+        print(f"Embedding store compacted: kept {len(rows)} vectors, dropped {dropped}")
+
+    def report(self):
+        print(f"Embedding store: {self.hits} reused, {self.encoded} encoded, {self.count} stored "
+              f"({self.count * self.row_bytes / 1024 / 1024:.1f} MB {self.dtype.name})")
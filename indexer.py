@@ -1,10 +1,24 @@
 import os
 import time
+import json
+import hashlib
+import argparse
+import random
+import queue
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch, NotFoundError, helpers
 import wikipediaapi
 import sys
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from wiki_cache import WikiCache
+from bulk_ingest import ingest, load_settings
+from checkpoint import CheckpointJournal
+from chunking import chunk_document, chunk_id
 
 # Ensure UTF-8 output on Windows for Hebrew/Arabic characters
 try:
@@ -21,21 +35,32 @@ ELASTIC_URL = os.getenv("ELASTIC_URL")
 ELASTIC_API_KEY = os.getenv("ELASTIC_API_KEY")
 ELASTIC_CLOUD_ID = os.getenv("ELASTIC_CLOUD_ID")
 
+# Read alias queried by search_app.py; each full build goes to a new INDEX_NAME-v<timestamp> index
 INDEX_NAME = "multilingual-scale-index"
+INDEX_VERSION_PREFIX = f"{INDEX_NAME}-v"
+# Versioned indices kept after a swap (the live one included), for rollback
+KEEP_INDEX_VERSIONS = int(os.getenv("KEEP_INDEX_VERSIONS", "2"))
 INFERENCE_ID = ".multilingual-e5-small-elasticsearch"  # Standard system ID
 
+# Using a more descriptive User-Agent as per Wikipedia policy
+USER_AGENT = 'MultilingualSemanticSearchDemo/1.0 (https://github.com/charactell-vitaly/elastic; contact: vitaly@example.com)'
+# Global request budget shared by all fetch threads (Wikipedia asks clients to stay polite)
+WIKI_MAX_RPS = float(os.getenv("WIKI_MAX_RPS", "10"))
+WIKI_WORKERS = int(os.getenv("WIKI_WORKERS", "8"))
+WIKI_MAX_RETRIES = int(os.getenv("WIKI_MAX_RETRIES", "5"))
+# Index full articles as overlapping passages instead of the first 5000 characters of the summary
+WIKI_CHUNKING = os.getenv("WIKI_CHUNKING", "true").lower() in ("1", "true", "yes")
+# Fetched pages waiting for bulk indexing; fetchers block when it is full
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "200"))
+PIPELINE_DONE = object()
+
 def get_es_client():
     if ELASTIC_CLOUD_ID:
         return Elasticsearch(cloud_id=ELASTIC_CLOUD_ID, api_key=ELASTIC_API_KEY, request_timeout=600)
     return Elasticsearch(ELASTIC_URL, api_key=ELASTIC_API_KEY, request_timeout=600)
 
-def setup_index(es):
-    """Create the index with semantic_text mapping."""
-    if es.indices.exists(index=INDEX_NAME):
-        print(f"Deleting existing index: {INDEX_NAME}")
-        es.indices.delete(index=INDEX_NAME)
-
-    mapping = {
+def index_mapping():
+    return {
         "mappings": {
             "properties": {
                 "title": {"type": "text"},
@@ -43,6 +68,10 @@ def setup_index(es):
                 "language": {"type": "keyword"},
                 "category": {"type": "keyword"},
                 "original_title": {"type": "text"}, # For cross-lingual keyword matching
+                "content_hash": {"type": "keyword"}, # Skips re-embedding unchanged documents
+                "parent_id": {"type": "keyword"}, # Article/file a passage belongs to; search collapses on it
+                "page": {"type": "integer"},
+                "chunk": {"type": "integer"},
                 "content": {
                     "type": "semantic_text",
                     "inference_id": INFERENCE_ID
@@ -50,14 +79,264 @@ def setup_index(es):
             }
         }
     }
-    es.indices.create(index=INDEX_NAME, body=mapping)
-    print(f"Created index: {INDEX_NAME} with semantic_text")
-
-def fetch_parallel_wikipedia_pages(languages=["en", "he", "ar"]):
-    """Fetch parallel subjects across multiple languages to ensure ground truth."""
-    # Using a more descriptive User-Agent as per Wikipedia policy
-    ua = 'MultilingualSemanticSearchDemo/1.0 (https://github.com/charactell-vitaly/elastic; contact: vitaly@example.com)'
-    wiki_clients = {lang: wikipediaapi.Wikipedia(user_agent=ua, language=lang) for lang in languages}
+
+
+def alias_targets(es):
+    """Indices currently behind the INDEX_NAME alias ([] if INDEX_NAME is not an alias)."""
+    try:
+        return sorted(es.indices.get_alias(name=INDEX_NAME).keys())
+    except NotFoundError:
+        return []
+
+
+def setup_index(es, rebuild=False):
+    """Return (write_index, is_new).
+
+    Updates go to the index behind the INDEX_NAME alias (or a legacy concrete
+    INDEX_NAME index). A rebuild, or the first run, creates a new versioned
+    index that only becomes visible through `swap_alias`.
+    """
+    targets = alias_targets(es) or ([INDEX_NAME] if es.indices.exists(index=INDEX_NAME) else [])
+    if targets and not rebuild:
+        write_index = targets[-1]
+        # Older indices were created without the hash and passage fields
+        es.indices.put_mapping(index=write_index, properties={
+            "content_hash": {"type": "keyword"},
+            "parent_id": {"type": "keyword"},
+            "page": {"type": "integer"},
+            "chunk": {"type": "integer"}
+        })
+        print(f"Using existing index: {write_index} (incremental update)")
+        return write_index, False
+
+    write_index = f"{INDEX_VERSION_PREFIX}{time.strftime('%Y%m%d%H%M%S')}"
+    es.indices.create(index=write_index, body=index_mapping())
+    print(f"Created index: {write_index} with semantic_text")
+    return write_index, True
+
+
+def warm_up(es, index):
+    """Make the new index searchable and run one query of each kind before it takes traffic."""
+    es.indices.refresh(index=index)
+    es.search(index=index, query={"semantic": {"field": "content", "query": "warm up"}}, size=1)
+    es.search(index=index, query={"multi_match": {"query": "warm up", "fields": ["title", "original_title"]}}, size=1)
+
+
+def swap_alias(es, new_index):
+    """Atomically point the INDEX_NAME alias at `new_index`."""
+    actions = [{"add": {"index": new_index, "alias": INDEX_NAME}}]
+    for old in alias_targets(es):
+        actions.append({"remove": {"index": old, "alias": INDEX_NAME}})
+    if not actions[1:] and es.indices.exists(index=INDEX_NAME):
+        # First versioned build: the legacy concrete index must go in the same call to free the name
+        actions.append({"remove_index": {"index": INDEX_NAME}})
+    es.indices.update_aliases(actions=actions)
+    print(f"Alias {INDEX_NAME} -> {new_index}")
+
+
+def delete_old_versions(es, keep=KEEP_INDEX_VERSIONS):
+    """Delete versioned indices beyond the newest `keep`, never the one behind the alias."""
+    live = set(alias_targets(es))
+    versions = sorted(es.indices.get(index=f"{INDEX_VERSION_PREFIX}*").keys(), reverse=True)
+    for name in versions[keep:]:
+        if name not in live:
+            es.indices.delete(index=name)
+            print(f"Deleted old index version: {name}")
+
+
+def parent_document_id(page):
+    """Deterministic id of an article: the same article always maps to the same documents."""
+    return hashlib.sha1(f"{page['language']}\n{page['url']}".encode("utf-8")).hexdigest()
+
+
+def document_id(page):
+    return chunk_id(parent_document_id(page), page.get("chunk", 0))
+
+
+def content_hash(page):
+    return hashlib.sha256(json.dumps(page, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+# Categories written by this script; other documents in the index (e.g. PDF protocols) are left alone
+WIKI_CATEGORIES = ["Parallel Ground Truth", "Background Noise"]
+
+
+def existing_hashes(es, index):
+    """Map of `_id` to stored content hash for every Wikipedia document already in `index`."""
+    hashes = {}
+    query = {"query": {"terms": {"category": WIKI_CATEGORIES}}}
+    for hit in helpers.scan(es, index=index, query=query, _source=["content_hash"], size=1000):
+        hashes[hit["_id"]] = hit["_source"].get("content_hash")
+    return hashes
+
+
+def incremental_actions(pages, hashes, index, counts, delete_missing=True, journal=None):
+    """Yield bulk actions for new or changed pages, then deletes for documents that are gone.
+
+    Unchanged pages produce no action and therefore no inference (they are
+    acknowledged to the `journal` right away). `counts` is updated as pages
+    stream through. Deletes are skipped if any fetch failed.
+    """
+    seen = set()
+    for page in pages:
+        doc_id = document_id(page)
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+        digest = content_hash(page)
+        if hashes.get(doc_id) == digest:
+            counts["unchanged"] += 1
+            if journal:
+                journal.ack([doc_id])
+            continue
+        counts["changed" if doc_id in hashes else "new"] += 1
+        yield {"_index": index, "_id": doc_id, "_source": {**page, "content_hash": digest}}
+    if delete_missing and fetch_failures:
+        print(f"{len(fetch_failures)} fetches failed; keeping documents that were not fetched this run.")
+    elif delete_missing:
+        # Units finished by an earlier run were not fetched again but are still current
+        kept = seen | (journal.done_ids() if journal else set())
+        for doc_id in hashes.keys() - kept:
+            counts["deleted"] += 1
+            yield {"_op_type": "delete", "_index": index, "_id": doc_id}
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every Wikipedia request in the process."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (the server told us to back off)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+wiki_limiter = TokenBucket(WIKI_MAX_RPS)
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """Transport adapter that rate-limits every request and retries throttled/failed ones.
+
+    429/503 responses honor `Retry-After` (pausing the shared bucket for all
+    threads); other transient failures use jittered exponential backoff.
+    """
+
+    def send(self, request, **kwargs):
+        for attempt in range(WIKI_MAX_RETRIES + 1):
+            wiki_limiter.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == WIKI_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                print(f" ? Network error ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if response.status_code not in (429, 503) or attempt == WIKI_MAX_RETRIES:
+                return response
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            print(f" ? Wikipedia returned {response.status_code}, backing off {delay:.1f}s")
+            wiki_limiter.pause(delay)
+            response.close()
+        return response
+
+
+def make_wiki_client(lang):
+    wiki = wikipediaapi.Wikipedia(user_agent=USER_AGENT, language=lang)
+    # wikipediaapi does not expose its session, but every API call goes through it
+    wiki._session.mount("https://", RateLimitedAdapter(pool_connections=4, pool_maxsize=WIKI_WORKERS))
+    return wiki
+
+
+# Fetch steps that gave up; stale documents are only deleted when this stays empty
+fetch_failures = []
+
+
+def with_retries(fn, what, attempts=4):
+    """Retry a whole fetch step (e.g. on a malformed API reply) with jittered backoff."""
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts - 1:
+                print(f" x Failed '{what}' after multiple attempts. Error: {e}")
+                fetch_failures.append(what)
+                return None
+            delay = backoff_delay(attempt)
+            print(f" ? Error for '{what}' (Attempt {attempt+1}). Retrying in {delay:.1f}s... Error: {e}")
+            time.sleep(delay)
+
+
+def page_documents(p, lang, category, original_title=None):
+    """Documents for one article: overlapping passages of the full text, or the summary alone."""
+    doc = {
+        "title": p["title"],
+        "url": p["fullurl"],
+        "content": p["summary"][:5000].strip(),
+        "language": lang,
+        "category": category
+    }
+    if original_title:
+        doc["original_title"] = original_title
+    parent_id = parent_document_id(doc)
+    if WIKI_CHUNKING:
+        # Offline cache entries from before full text was cached only have the summary
+        return chunk_document(doc, parent_id, [(None, p.get("text") or p["summary"])])
+    return [{**doc, "parent_id": parent_id, "chunk": 0}]
+
+
+def fetch_parallel_wikipedia_pages(languages=["en", "he", "ar"], cache=None, journal=None):
+    """Fetch parallel subjects across multiple languages to ensure ground truth.
+
+    Yields (unit, documents) subject by subject as soon as each subject is
+    complete. Subjects already in the checkpoint `journal` are skipped.
+    """
+    cache = cache or WikiCache()
+    wiki_clients = {lang: make_wiki_client(lang) for lang in languages}
     en_wiki = wiki_clients['en']
     
     # Core evaluation subjects (Ground Truth)
@@ -73,136 +352,208 @@ def fetch_parallel_wikipedia_pages(languages=["en", "he", "ar"]):
         "Thermodynamics", "Electromagnetism", "Gravity", "String theory", "Higgs boson"
     ]
     
-    pages_to_index = []
-    print(f"Starting sequential parallel fetching for {len(subjects)} subjects across {languages}...")
-    
-    for en_title in subjects:
-        # Exponential backoff retry logic
-        success = False
-        for attempt in range(4):
-            try:
-                en_page = en_wiki.page(en_title)
-                if not en_page.exists():
-                    print(f" ! English subject '{en_title}' does not exist. Skipping.")
-                    break
-                
-                # Map of language to title for this subject
-                lang_map = {'en': en_title}
-                langlinks = en_page.langlinks
-                for lang in languages:
-                    if lang != 'en' and lang in langlinks:
-                        lang_map[lang] = langlinks[lang].title
-                
-                subject_pages = []
-                # Fetch content for all available languages for this subject
-                for lang, title in lang_map.items():
-                    p = wiki_clients[lang].page(title)
-                    if p.exists():
-                        subject_pages.append({
-                            "title": p.title,
-                            "original_title": en_title,
-                            "url": p.fullurl,
-                            "content": p.summary[:5000].strip(),
-                            "language": lang,
-                            "category": "Parallel Ground Truth"
-                        })
-                    time.sleep(0.2) # Throttling within subject
-                
-                pages_to_index.extend(subject_pages)
-                print(f" + Gathered: {en_title} ({len(subject_pages)} languages)")
-                success = True
+    if journal:
+        subjects = [t for t in subjects if not journal.is_done(f"subject:{t}")]
+    print(f"Starting concurrent parallel fetching for {len(subjects)} subjects across {languages} "
+          f"({WIKI_WORKERS} workers, {WIKI_MAX_RPS:g} req/s)...")
+
+    # Languages of one subject are fetched on their own pool so subject workers never wait on themselves
+    with ThreadPoolExecutor(max_workers=WIKI_WORKERS) as subject_pool, \
+         ThreadPoolExecutor(max_workers=WIKI_WORKERS) as page_pool:
+
+        def fetch_language(lang, title, en_title):
+            p = cache.page(wiki_clients[lang], title)
+            if p:
+                return page_documents(p, lang, "Parallel Ground Truth", original_title=en_title)
+            return []
+
+        def fetch_subject(en_title):
+            en_page = cache.page(en_wiki, en_title)
+            if not en_page:
+                print(f" ! English subject '{en_title}' does not exist. Skipping.")
+                return []
+
+            # Map of language to title for this subject
+            lang_map = {'en': en_title}
+            langlinks = en_page["langlinks"]
+            for lang in languages:
+                if lang != 'en' and lang in langlinks:
+                    lang_map[lang] = langlinks[lang]
+
+            # Fetch content for all available languages of this subject concurrently
+            futures = [page_pool.submit(fetch_language, lang, title, en_title) for lang, title in lang_map.items()]
+            languages_found = [f.result() for f in futures if f.result()]
+            print(f" + Gathered: {en_title} ({len(languages_found)} languages)")
+            return [doc for docs in languages_found for doc in docs]
+
+        futures = {subject_pool.submit(with_retries, lambda t=t: fetch_subject(t), t): t for t in subjects}
+        try:
+            for future in as_completed(futures):
+                # A subject that failed is not yielded, so it is not checkpointed either
+                if future.result() is not None:
+                    yield f"subject:{futures[future]}", future.result()
+        finally:
+            # Stopped early (the pipeline was aborted): do not start the remaining subjects
+            for future in futures:
+                future.cancel()
+
+
+NOISE_SEEDS = {
+    "en": ["Earth", "History", "Science", "Technology", "World", "Society"],
+    "he": ["כדור_הארץ", "היסטוריה", "מדע", "טכנולוגיה", "עולם", "חברה"],
+    "ar": ["الأرض", "تاریخ", "علوم", "تكنولوجيا", "عالم", "مجتمع"]
+}
+
+
+def fetch_noise_batch(lang, count=50, cache=None, journal=None):
+    """Fetch up to `count` "Background Noise" pages: the seed pages and pages they link to.
+
+    Yields (unit, documents) per seed; seeds already in the checkpoint `journal` are skipped.
+    """
+    cache = cache or WikiCache()
+    wiki = make_wiki_client(lang)
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=WIKI_WORKERS) as pool:
+        for seed in NOISE_SEEDS[lang]:
+            if fetched >= count:
                 break
-            except Exception as e:
-                wait_time = (2 ** attempt) + 1
-                if attempt < 3:
-                    print(f" ? Rate limit/error for '{en_title}' (Attempt {attempt+1}). Retrying in {wait_time}s... Error: {e}")
-                    time.sleep(wait_time)
-                else:
-                    print(f" x Failed '{en_title}' after multiple attempts. Error: {e}")
-        
-        # Consistent delay between different subjects
-        time.sleep(0.5)
-                
-    return pages_to_index
+            unit = f"noise:{lang}:{seed}"
+            if journal and journal.is_done(unit):
+                # Count articles, not passages
+                fetched += sum(1 for doc_id in journal.unit_ids(unit) if "-" not in doc_id)
+                continue
+            p = with_retries(lambda: cache.page(wiki, seed, links=True), seed)
+            if not p:
+                continue
+            links = p["links"]
+            docs = page_documents(p, lang, "Background Noise")
+            articles = 1
+
+            # Try sub-pages or links for more variety
+            def fetch_link(link_title):
+                lp = cache.page(wiki, link_title)
+                return page_documents(lp, lang, "Background Noise") if lp else None
+
+            wanted = count - fetched - 1
+            for link_docs in pool.map(lambda t: with_retries(lambda: fetch_link(t), t, attempts=2), links[:wanted]):
+                if link_docs:
+                    docs.extend(link_docs)
+                    articles += 1
+            fetched += articles
+            yield unit, docs
+
+
+def produce_pages(cache, out, journal, stop):
+    """Fetcher side of the pipeline: ground truth and noise run concurrently into the bounded queue.
+
+    `put` blocks while the queue is full, so fetching slows down to the pace of indexing.
+    Every page is registered with its unit in the checkpoint journal first.
+    Setting `stop` makes the fetchers return after their current unit.
+    """
+    sources = [lambda: fetch_parallel_wikipedia_pages(languages=["en", "he", "ar"], cache=cache, journal=journal)]
+    sources += [lambda lang=lang: fetch_noise_batch(lang, 50, cache, journal) for lang in ["en", "he", "ar"]]
+
+    def drain(source):
+        units = source()
+        try:
+            for unit, docs in units:
+                if stop.is_set():
+                    return
+                for doc in docs:
+                    journal.add(unit, document_id(doc))
+                    out.put(doc)
+                journal.fetched(unit)
+        finally:
+            units.close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+            for future in [pool.submit(drain, source) for source in sources]:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f" x Fetcher failed: {e}")
+                    fetch_failures.append(str(e))
+        # Offline, a page missing from the cache is unknown rather than gone: keep its documents
+        if cache.misses:
+            fetch_failures.append(f"{cache.misses} pages not in the offline Wikipedia cache")
+    finally:
+        out.put(PIPELINE_DONE)
+
+
+def consume_pages(pages):
+    """Indexer side of the pipeline: yield pages from the queue until the fetchers are done."""
+    while True:
+        page = pages.get()
+        if page is PIPELINE_DONE:
+            return
+        yield page
 
 def main():
+    parser = argparse.ArgumentParser(description="Fetch Wikipedia articles and index them into Elasticsearch.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Build a new index version and swap the alias instead of updating in place")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run, skipping subjects and seeds that were already indexed")
+    args = parser.parse_args()
+
     es = get_es_client()
-    setup_index(es)
-    
-    # 1. Parallel Ground Truth (Approx 130-150 pages)
-    all_pages = fetch_parallel_wikipedia_pages(languages=["en", "he", "ar"])
-    
-    # 2. Add "Background Noise" (Approx 150-200 more pages)
-    print("\nGathering background noise (random articles)...")
-    ua = 'MultilingualSemanticSearchDemo/1.0 (https://github.com/charactell-vitaly/elastic; contact: vitaly@example.com)'
-    wiki_en = wikipediaapi.Wikipedia(user_agent=ua, language='en')
-    wiki_he = wikipediaapi.Wikipedia(user_agent=ua, language='he')
-    wiki_ar = wikipediaapi.Wikipedia(user_agent=ua, language='ar')
-    
-    def fetch_noise_batch(wiki, lang, count=50):
-        noise = []
-        # Use simple common words or broad categories
-        seeds = ["Earth", "History", "Science", "Technology", "World", "Society"] if lang == 'en' else \
-                ["כדור_הארץ", "היסטוריה", "מדע", "טכנולוגיה", "עולם", "חברה"] if lang == 'he' else \
-                ["الأرض", "تاریخ", "علوم", "تكنولوجيا", "عالم", "مجتمع"]
-        
-        fetched = 0
-        for seed in seeds:
-            try:
-                p = wiki.page(seed)
-                if p.exists():
-                    noise.append({
-                        "title": p.title,
-                        "url": p.fullurl,
-                        "content": p.summary[:5000].strip(),
-                        "language": lang,
-                        "category": "Background Noise"
-                    })
-                    fetched += 1
-                # Try sub-pages or links for more variety
-                for link_title in list(p.links.keys())[:count]:
-                    if fetched >= count: break
-                    lp = wiki.page(link_title)
-                    if lp.exists():
-                        noise.append({
-                            "title": lp.title,
-                            "url": lp.fullurl,
-                            "content": lp.summary[:5000].strip(),
-                            "language": lang,
-                            "category": "Background Noise"
-                        })
-                        fetched += 1
-                    time.sleep(0.3) # Throttling within link iteration
-            except Exception:
-                continue
-            if fetched >= count: break
-            time.sleep(0.5) # Throttling between seeds
-        return noise
-
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        noise_results = list(executor.map(lambda x: fetch_noise_batch(x[0], x[1], 50), [(wiki_en, "en"), (wiki_he, "he"), (wiki_ar, "ar")]))
-        for batch in noise_results:
-            all_pages.extend(batch)
-    
-    print(f"\nTotal pages to index: {len(all_pages)}")
-    
-    print("Performing bulk indexing...")
-    actions = [
-        {
-            "_index": INDEX_NAME,
-            "_source": page
-        }
-        for page in all_pages
-    ]
-    
+    journal = CheckpointJournal("indexer", resume=args.resume)
+    write_index = journal.meta.get("write_index")
+    if write_index and es.indices.exists(index=write_index):
+        is_new = journal.meta["is_new"]
+        print(f"Resuming into index: {write_index}")
+    else:
+        write_index, is_new = setup_index(es, rebuild=args.rebuild)
+        journal.set_meta(write_index=write_index, is_new=is_new)
+
+    hashes = {} if is_new else existing_hashes(es, write_index)
+
+    # Fetchers (Parallel Ground Truth, ~130-150 pages, and "Background Noise", ~150 more)
+    # feed a bounded queue; bulk indexing consumes it while fetching is still going on
+    print("Fetching and indexing Wikipedia pages...")
+    cache = WikiCache()
+    pages = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    producer = threading.Thread(target=produce_pages, args=(cache, pages, journal, stop))
+    producer.start()
+
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "deleted": 0}
     try:
-        # Use a small chunk size to avoid payload limits
-        success, failed = helpers.bulk(es, actions, stats_only=False, chunk_size=10, raise_on_error=False)
-        print(f"Successfully indexed {success} documents.")
-        if failed:
-            print(f"Failed to index {len(failed)} documents.")
+        actions = incremental_actions(consume_pages(pages), hashes, write_index, counts, journal=journal)
+        with load_settings(es, write_index, "rebuild" if is_new else "live") as load:
+            stats = ingest(es, actions, label="pages", on_ack=journal.ack)
+            load["failed"] = stats.failed
+        failed, indexed = stats.failed, stats.ok
     except Exception as e:
         print(f"Critical error during bulk: {e}")
+        failed, indexed = True, 0
+        # Unblock the fetchers and let them wind down; `--resume` picks up from the journal.
+        # The consumer may already have taken PIPELINE_DONE, so drain only while they run
+        stop.set()
+        while producer.is_alive():
+            try:
+                pages.get(timeout=1)
+            except queue.Empty:
+                pass
+    finally:
+        # The fetchers complete units too, so the journal is closed once they are done
+        producer.join()
+        journal.close()
+    cache.report()
+    print(f"New: {counts['new']}, changed: {counts['changed']}, unchanged: {counts['unchanged']}, "
+          f"deleted: {counts['deleted']}")
+    if not indexed and not failed:
+        print("Index is up to date.")
+
+    if is_new:
+        # A resumed build may have nothing left to send; its earlier runs filled the index
+        if failed or not (indexed or args.resume):
+            print(f"Not switching {INDEX_NAME} to {write_index}: indexing failed or indexed nothing.")
+            return
+        warm_up(es, write_index)
+        swap_alias(es, write_index)
+        delete_old_versions(es)
 
 if __name__ == "__main__":
     start_time = time.time()
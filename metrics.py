@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Latency buckets in seconds (Prometheus histogram `le` bounds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+# Percentiles are computed over the most recent samples of each series
+PERCENTILE_WINDOW = int(os.getenv("METRICS_PERCENTILE_WINDOW", "1024"))
+# Requests slower than this (seconds) are printed with their stage breakdown; 0 disables the log
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0"))
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """Prometheus-style histogram that also keeps a sliding window of samples for percentiles."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "counts": [0] * len(self.buckets), "sum": 0.0, "count": 0,
+                    "recent": deque(maxlen=PERCENTILE_WINDOW)
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [
+            f"# HELP {self.name}_percentile {self.help_text} (percentiles of the last {PERCENTILE_WINDOW} samples)",
+            f"# TYPE {self.name}_percentile gauge"
+        ]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_label_str(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_str(key + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{_label_str(key)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_label_str(key)} {series['count']}")
+                recent = sorted(series["recent"])
+                for q in PERCENTILES:
+                    value = recent[min(len(recent) - 1, int(q * len(recent)))]
+                    quantile_lines.append(f"{self.name}_percentile{_label_str(key + (('quantile', q),))} {value:.6f}")
+        return lines + quantile_lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(key)} {value}")
+        return lines
+
+
+stage_seconds = Histogram("search_stage_seconds", "Time spent per request stage")
+es_took_seconds = Histogram("search_es_took_seconds", "Elasticsearch-reported `took` per request")
+requests_total = Counter("search_requests_total", "Requests handled")
+inference_calls_total = Counter("search_inference_calls_total", "Query embedding inference calls (server = semantic clause on the ML node)")
+slow_queries_total = Counter("search_slow_queries_total", "Requests slower than SLOW_QUERY_SECONDS")
+
+REGISTRY = (stage_seconds, es_took_seconds, requests_total, inference_calls_total, slow_queries_total)
+
+
+def render_prometheus():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def filter_label(lang, cat):
+    """Low-cardinality label describing which filters were applied."""
+    parts = [name for name, value in (("lang", lang), ("cat", cat)) if value]
+    return "+".join(parts) or "none"
+
+
+class RequestTimer:
+    """Collects per-stage timings for one request and records them on `finish`.
+
+    Stages used more than once (e.g. one ES call per streamed page) accumulate.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.took_ms = 0
+        self.inference = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def es_response(self, resp):
+        """Record ES `took`; the rest of the ES stage is network and client overhead."""
+        took = resp.get("took")
+        if took is not None:
+            self.took_ms += took
+
+    def count_inference(self, source, calls=1):
+        self.inference[source] = self.inference.get(source, 0) + calls
+
+    def finish(self, mode, filters="none", cache="none", detail=None):
+        total = time.perf_counter() - self.started
+        labels = {"endpoint": self.endpoint, "mode": mode, "filter": filters, "cache": cache}
+        for name, seconds in self.stages.items():
+            stage_seconds.observe(seconds, stage=name, **labels)
+        stage_seconds.observe(total, stage="total", **labels)
+        if "es" in self.stages:
+            took = self.took_ms / 1000.0
+            es_took_seconds.observe(took, **labels)
+            stage_seconds.observe(max(self.stages["es"] - took, 0.0), stage="es_network", **labels)
+        requests_total.inc(**labels)
+        for source, calls in self.inference.items():
+            inference_calls_total.inc(calls, endpoint=self.endpoint, source=source)
+
+        if SLOW_QUERY_SECONDS and total >= SLOW_QUERY_SECONDS:
+            slow_queries_total.inc(**labels)
+            breakdown = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.stages.items())
+            print(f"SLOW QUERY {total * 1000:.1f}ms [{self.endpoint} {mode} {filters} cache={cache}] "
+                  f"took={self.took_ms}ms {breakdown} {detail or ''}")
+        return total
@@ -1,8 +1,16 @@
 import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 import fitz # PyMuPDF
 from langdetect import detect
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
+from bulk_ingest import ingest, load_settings
+from checkpoint import CheckpointJournal
+from chunking import chunk_pages, chunk_id
 
 load_dotenv()
 
@@ -12,24 +20,43 @@ ELASTIC_API_KEY = os.getenv("ELASTIC_API_KEY")
 ELASTIC_CLOUD_ID = os.getenv("ELASTIC_CLOUD_ID")
 INDEX_NAME = "multilingual-scale-index"
 
+PROTOCOL_DIR = os.getenv("PROTOCOL_DIR", r"D:\Users\vital\Download\Elastic-protocols\proptocols")
+# Processes parsing PDFs (PyMuPDF and langdetect are CPU-bound)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 4)))
+# Characters of text kept per protocol when PDF_CHUNKING is off; pages after the budget are not parsed.
+# With chunking every page is read and indexed, so the budget does not apply
+PDF_CONTENT_CHARS = int(os.getenv("PDF_CONTENT_CHARS", "10000"))
+# Index whole documents as overlapping passages (child documents) instead of the first PDF_CONTENT_CHARS
+PDF_CHUNKING = os.getenv("PDF_CHUNKING", "true").lower() in ("1", "true", "yes")
+# Files indexed so far (size, mtime, sha256 and document ids per path); unchanged files are skipped
+PDF_MANIFEST_PATH = os.getenv("PDF_MANIFEST_PATH", ".pdf_manifest.json")
+
 def get_es_client():
     if ELASTIC_CLOUD_ID:
         return Elasticsearch(cloud_id=ELASTIC_CLOUD_ID, api_key=ELASTIC_API_KEY, request_timeout=600)
     return Elasticsearch(ELASTIC_URL, api_key=ELASTIC_API_KEY, request_timeout=600)
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF and return content string. Return None if no text found."""
-    try:
-        text = ""
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text()
-        
-        text = text.strip()
-        return text if len(text) > 50 else None # Simple threshold for image-only PDFs
-    except Exception as e:
-        print(f"Error reading {pdf_path}: {e}")
-        return None
+def read_pdf_pages(pdf_path, max_chars=PDF_CONTENT_CHARS):
+    """Yield (page_number, text) in order until `max_chars` characters were read (None reads all)."""
+    total = 0
+    with fitz.open(pdf_path) as doc:
+        for number, page in enumerate(doc, start=1):
+            text = page.get_text()
+            yield number, text
+            total += len(text)
+            if max_chars is not None and total >= max_chars:
+                return
+
+
+def read_pdf_text(pdf_path, max_chars=PDF_CONTENT_CHARS):
+    """Read pages until `max_chars` characters are collected (None reads all).
+
+    Returns (text, pages_read). Page texts are joined once, in linear time.
+    """
+    parts = [text for _, text in read_pdf_pages(pdf_path, max_chars)]
+    text = "".join(parts).strip()
+    return (text[:max_chars] if max_chars is not None else text), len(parts)
+
 
 def detect_language(text):
     """Detect language of text. Fallback to 'en'."""
@@ -38,8 +65,235 @@ def detect_language(text):
     except:
         return "en"
 
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_pdf_files(root):
+    """Yield (path, size, mtime) of every PDF below `root`, recursively, as the walk goes."""
+    try:
+        entries = os.scandir(root)
+    except OSError as e:
+        print(f"Error listing {root}: {e}")
+        return
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from iter_pdf_files(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(".pdf"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime_ns
+            except OSError as e:
+                print(f"Error reading {entry.path}: {e}")
+
+
+class PdfManifest:
+    """JSON manifest of indexed protocol files: path -> size, mtime, sha256 and document ids.
+
+    It belongs to the concrete index the documents were written to; after
+    `indexer.py --rebuild` moves the alias to a new version it starts empty.
+    """
+
+    def __init__(self, path=PDF_MANIFEST_PATH):
+        self.path = path
+        self.index = None
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.index = data.get("index")
+            self.files = data.get("files", {})
+
+    def bind(self, index):
+        if self.index != index:
+            if self.files:
+                print(f"Manifest belongs to {self.index}, not {index}: re-indexing all protocols")
+            self.index = index
+            self.files = {}
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"index": self.index, "files": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+def prepare_pdf(path, known_sha256=None, chunking=PDF_CHUNKING):
+    """Worker: extract one PDF, detect its language and split it into passages.
+
+    Returns (path, passages, lang, info) with passages as [(page, text), ...]:
+    the whole document in overlapping chunks, or the first PDF_CONTENT_CHARS
+    characters as one passage when chunking is off. No passages = no usable text.
+    A file whose sha256 equals `known_sha256` is not extracted (info["unchanged"]).
+    """
+    start = time.perf_counter()
+    info = {"file_bytes": os.path.getsize(path), "pages": 0, "sha256": None}
+    passages = []
+    try:
+        info["sha256"] = file_sha256(path)
+        if info["sha256"] == known_sha256:
+            info["unchanged"] = True
+            return path, passages, None, info
+        if chunking:
+            pages = list(read_pdf_pages(path, max_chars=None))
+            info["pages"] = len(pages)
+            if sum(len(text.strip()) for _, text in pages) > 50: # Simple threshold for image-only PDFs
+                passages = chunk_pages(pages)
+        else:
+            content, info["pages"] = read_pdf_text(path)
+            if len(content) > 50:
+                passages = [(1, content)]
+    except Exception as e:
+        print(f"Error reading {path}: {e}")
+        info["error"] = True
+    info["text_bytes"] = sum(len(text.encode("utf-8")) for _, text in passages)
+    info["seconds"] = time.perf_counter() - start
+    lang = detect_language(passages[0][1][:1000]) if passages else None
+    return path, passages, lang, info
+
+
+def extract_pdfs(files, workers=PDF_WORKERS):
+    """Run `prepare_pdf` over (path, known_sha256) pairs on a process pool, yielding results as they finish.
+
+    Only a bounded number of files is submitted ahead, so results stream into
+    bulk indexing while the remaining files are still being parsed.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for path, known_sha256 in files:
+            pending.add(pool.submit(prepare_pdf, path, known_sha256))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def files_to_extract(root, manifest, journal, scanned, results, counts, full=False):
+    """(path, known_sha256) for new and modified PDFs below `root`.
+
+    Files whose size and mtime match the manifest are skipped without being
+    read; for the rest the worker compares the sha256 before extracting.
+    Every file found is recorded in `scanned` (path -> (size, mtime)).
+    """
+    for path, size, mtime in iter_pdf_files(root):
+        scanned[path] = (size, mtime)
+        unit = f"pdf:{path}"
+        if journal.is_done(unit):
+            # Indexed by the interrupted run, which may have stopped before saving the manifest
+            results[path] = (unit, {"size": size, "mtime": mtime, "sha256": file_sha256(path),
+                                    "ids": journal.unit_ids(unit)})
+            continue
+        entry = None if full else manifest.files.get(path)
+        if entry and entry["size"] == size and entry["mtime"] == mtime:
+            counts["unchanged"] += 1
+            continue
+        yield path, entry["sha256"] if entry else None
+
+
+def delete_action(doc_id):
+    return {"_op_type": "delete", "_index": INDEX_NAME, "_id": doc_id}
+
+
+def pdf_actions(root, manifest, journal, results, counts, full=False):
+    """Bulk actions for new, modified and removed PDFs below `root`, registered with the checkpoint journal.
+
+    Passages a modified file no longer has and all documents of removed files
+    are deleted. `results` collects (unit, manifest entry) for every processed
+    path (entry None for removed files); main() applies the ones whose unit completed.
+    """
+    scanned = {}
+    for path, passages, lang, info in extract_pdfs(files_to_extract(root, manifest, journal, scanned, results, counts, full)):
+        size, mtime = scanned[path]
+        entry = manifest.files.get(path)
+        if info.get("unchanged"):
+            # Touched but identical: only the stat changed
+            counts["unchanged"] += 1
+            results[path] = (None, {**entry, "size": size, "mtime": mtime})
+            continue
+        if info.get("error"):
+            counts["failed"] += 1
+            continue # Retried on the next run
+
+        unit = f"pdf:{path}"
+        filename = os.path.basename(path)
+        counts["modified" if entry else "new"] += 1
+        ids = []
+        if passages:
+            url = "file:///" + path.replace("\\", "/")
+            # Stable id so a resumed or repeated run overwrites instead of duplicating
+            parent_id = hashlib.sha1(url.encode("utf-8")).hexdigest()
+            print(f" + Prepared: {filename} (Lang: {lang}, {info['pages']} pages read, {len(passages)} chunks, "
+                  f"{info['file_bytes'] / 1024:.0f} KB -> {info['text_bytes'] / 1024:.1f} KB text, {info['seconds']:.2f}s)")
+            for number, (page, passage) in enumerate(passages):
+                doc_id = chunk_id(parent_id, number)
+                ids.append(doc_id)
+                journal.add(unit, doc_id)
+                yield {
+                    "_index": INDEX_NAME,
+                    "_id": doc_id,
+                    "_source": {
+                        "title": filename,
+                        "url": url,
+                        "language": lang,
+                        "category": "Protocol",
+                        "content": passage,
+                        "original_title": filename,
+                        "parent_id": parent_id,
+                        "page": page,
+                        "chunk": number
+                    }
+                }
+        else:
+            print(f" - Skipped: {filename} (Likely image-only or corrupt, {info['seconds']:.2f}s)")
+        # Passages beyond the new length (or all of them, if the file has no text anymore)
+        for doc_id in set(entry["ids"] if entry else ()) - set(ids):
+            journal.add(unit, doc_id, record=False)
+            yield delete_action(doc_id)
+        results[path] = (unit, {"size": size, "mtime": mtime, "sha256": info["sha256"], "ids": ids})
+        journal.fetched(unit)
+
+    prefix = os.path.join(root, "")
+    for path, entry in list(manifest.files.items()):
+        if path in scanned or not path.startswith(prefix):
+            continue
+        unit = f"pdf-removed:{path}"
+        print(f" - Removed: {os.path.basename(path)} ({len(entry['ids'])} documents)")
+        counts["removed"] += 1
+        for doc_id in entry["ids"]:
+            journal.add(unit, doc_id, record=False)
+            yield delete_action(doc_id)
+        results[path] = (unit, None)
+        journal.fetched(unit)
+
+
+def update_manifest(manifest, journal, results):
+    """Record processed files whose documents were all acknowledged; the rest are retried next run."""
+    for path, (unit, entry) in results.items():
+        if unit is not None and not journal.is_done(unit):
+            continue
+        if entry is None:
+            manifest.files.pop(path, None)
+        else:
+            manifest.files[path] = entry
+    manifest.save()
+
+
 def main():
-    protocol_dir = r"D:\Users\vital\Download\Elastic-protocols\proptocols"
+    parser = argparse.ArgumentParser(description="Extract PDF protocols and add them to the search index.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run, skipping files that were already indexed")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-extract every PDF instead of only new and modified ones")
+    args = parser.parse_args()
+
+    protocol_dir = PROTOCOL_DIR
     if not os.path.exists(protocol_dir):
         print(f"Error: Directory not found: {protocol_dir}")
         return
@@ -51,44 +305,27 @@ def main():
         print(f"Error: Index {INDEX_NAME} not found. Please run indexer.py first.")
         return
 
-    pdf_files = [f for f in os.listdir(protocol_dir) if f.lower().endswith(".pdf")]
-    print(f"Found {len(pdf_files)} PDF files. Starting extraction...")
-
-    actions = []
-    for filename in pdf_files:
-        path = os.path.join(protocol_dir, filename)
-        content = extract_text_from_pdf(path)
-        
-        if content:
-            lang = detect_language(content[:1000])
-            doc = {
-                "title": filename,
-                "url": f"file:///{path.replace('\\', '/')}",
-                "language": lang,
-                "category": "Protocol",
-                "content": content[:10000], # Limit content size for inference
-                "original_title": filename
-            }
-            
-            actions.append({
-                "_index": INDEX_NAME,
-                "_source": doc
-            })
-            print(f" + Prepared: {filename} (Lang: {lang})")
-        else:
-            print(f" - Skipped: {filename} (Likely image-only or corrupt)")
-
-    if actions:
-        print(f"\nIndexing {len(actions)} protocols to {INDEX_NAME}...")
-        try:
-            success, failed = helpers.bulk(es, actions, stats_only=False, chunk_size=5)
-            print(f"Successfully indexed {success} documents.")
-            if failed:
-                print(f"Failed to index {len(failed)} documents.")
-        except Exception as e:
-            print(f"Critical error during bulk: {e}")
-    else:
-        print("No valid text documents found to index.")
+    manifest = PdfManifest()
+    # The concrete index behind the alias; a rebuild replaces it and drops all protocols
+    manifest.bind(",".join(sorted(es.indices.get(index=INDEX_NAME).keys())))
+    journal = CheckpointJournal("pdf_indexer", resume=args.resume)
+    print(f"Scanning {protocol_dir} for new, modified and removed PDFs. "
+          f"Extracting on {PDF_WORKERS} processes and indexing to {INDEX_NAME}...")
+
+    results = {}
+    counts = {"new": 0, "modified": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    try:
+        with load_settings(es, INDEX_NAME, "live") as load:
+            stats = ingest(es, pdf_actions(protocol_dir, manifest, journal, results, counts, args.full),
+                           label="protocol documents", on_ack=journal.ack)
+            load["failed"] = stats.failed
+    except Exception as e:
+        print(f"Critical error during bulk: {e}")
+    finally:
+        update_manifest(manifest, journal, results)
+        journal.close()
+    print(f"Protocols: {counts['new']} new, {counts['modified']} modified, {counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed, {counts['failed']} failed to read")
 
 if __name__ == "__main__":
     main()
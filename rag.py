@@ -0,0 +1,65 @@
+import time
+
+# Use the cloud index for best semantic context
+RAG_INDEX_NAME = "ct-multilingual-semantic-index"
+
+# MOCK RAG LOGIC
+# In a real app, this would call OpenAI or Gemini
+def simulate_ai_answer(query, context, title):
+    time.sleep(1) # Fake thinking
+    
+    if "ירושלים" in title or "ירושלים" in context or "Jerusalem" in query.lower():
+        return f"Jerusalem is one of the world's oldest cities with a rich history spanning millennia. According to the fetched content from Wikipedia, it is central to many cultures and has undergone significant historical transitions. Based on this documentation, politics in Jerusalem remain a key area of global interest."
+    elif "מדע" in title or "Science" in query.lower():
+        return f"Science (מדע) is the systematic study of the physical and natural world through observation and experiment. The Wikipedia context indexed in Elasticsearch highlights that modern science has evolved through centuries of research and remains the primary driver of human technological progress."
+    elif "ישראל" in title or "Israel" in query.lower():
+        return f"Israel is a country in the Middle East with a deep history. The retrieval from your Elastic index shows it has a rich cultural and technological landscape. Based on the Wikipedia summary, it emerged as a modern independent state with a unique synthesis of ancient and modern elements."
+    
+    return f"Based on the documents found in your index: {context[:200]}..."
+
+def build_rag_body(query_text, category_filter):
+    semantic_clause = {
+        "semantic": {
+            "field": "content",
+            "query": query_text
+        }
+    }
+    
+    search_body = {"query": semantic_clause}
+    if category_filter:
+        search_body = {
+            "query": {
+                "bool": {
+                    "must": [semantic_clause],
+                    "filter": [{"term": {"category": category_filter}}]
+                }
+            }
+        }
+    return search_body
+
+def rag_response(query_text, hits):
+    if not hits:
+        return {"answer": "I couldn't find any relevant data in your index to answer that.", "results": [], "source_title": "N/A"}
+
+    # Top hit becomes our 'context'
+    top_hit = hits[0]['_source']
+    context = top_hit['content']
+    source_title = top_hit['title']
+
+    # 2. GENERATION STEP (Simulated)
+    answer = simulate_ai_answer(query_text, context, source_title)
+
+    results = []
+    for hit in hits:
+        results.append({
+            "title": hit['_source'].get('title'),
+            "content": hit['_source'].get('content'),
+            "category": hit['_source'].get('category'),
+            "score": hit['_score']
+        })
+
+    return {
+        "answer": answer,
+        "results": results,
+        "source_title": source_title
+    }
@@ -1,8 +1,15 @@
 import os
-from flask import Flask, request, jsonify, render_template_string
+import json
+import time
+import base64
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, ApiError, NotFoundError
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -20,7 +27,396 @@ if ELASTIC_CLOUD_ID:
 else:
     es = Elasticsearch(ELASTIC_URL, api_key=ELASTIC_API_KEY)
 
+# Alias maintained by indexer.py (points at the live multilingual-scale-index-v<timestamp>)
 INDEX_NAME = "multilingual-scale-index"
+INFERENCE_ID = ".multilingual-e5-small-elasticsearch"
+
+# Query embedding mode:
+#   "server"    - `semantic` clause, the ML node embeds the query on every request (default)
+#   "inference" - embed once via the inference API, cache the vector, send a `knn` query
+#   "local"     - embed once with a local E5 model, cache the vector, send a `knn` query
+QUERY_EMBEDDING = os.getenv("QUERY_EMBEDDING", "server").lower()
+LOCAL_MODEL_NAME = os.getenv("LOCAL_MODEL_NAME", "intfloat/multilingual-e5-small")
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("QUERY_VECTOR_CACHE_SIZE", "4096"))
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "100"))
+
+# Ranking mode (overridable per request with "mode"):
+#   "hybrid"     - semantic (boost 2.0) + BM25 scores added in one bool.should query
+#   "rrf"        - `rrf` retriever over a BM25 and a semantic retriever (falls back to rrf_client)
+#   "rrf_client" - both legs run as separate searches in one msearch, fused here with RRF
+SEARCH_MODES = ("hybrid", "rrf", "rrf_client")
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid").lower()
+RRF_RANK_WINDOW_SIZE = int(os.getenv("RRF_RANK_WINDOW_SIZE", "50"))
+RRF_RANK_CONSTANT = int(os.getenv("RRF_RANK_CONSTANT", "60"))
+
+# Response shaping: only the rendered fields are fetched; content comes back as
+# semantic highlight fragments (or a prefix for match_all) unless "full": true
+SOURCE_FIELDS = ["title", "url", "language", "category", "parent_id", "page"]
+SNIPPET_CHARS = int(os.getenv("SNIPPET_CHARS", "400"))
+HIGHLIGHT_FRAGMENTS = int(os.getenv("HIGHLIGHT_FRAGMENTS", "1"))
+
+# Point-in-time pagination ("paginate": true, then "cursor" from the previous page)
+PIT_KEEP_ALIVE = os.getenv("PIT_KEEP_ALIVE", "2m")
+# Pages are collapsed per article/file and addressed with `from`, so they end at the index's max_result_window
+PAGINATION_MAX_RESULTS = int(os.getenv("PAGINATION_MAX_RESULTS", "10000"))
+
+# Streaming ("stream": "ndjson" | "sse"): first page is small so the first card renders quickly
+STREAM_FIRST_PAGE = int(os.getenv("STREAM_FIRST_PAGE", "5"))
+STREAM_PAGE_SIZE = int(os.getenv("STREAM_PAGE_SIZE", "100"))
+
+# Facets ("facets": true): indexed field -> request parameter that filters on it
+FACET_FIELDS = {"language": "lang", "category": "cat"}
+FACET_SIZE = int(os.getenv("FACET_SIZE", "20"))
+
+# Max search specs accepted by /search/batch
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "50"))
+
+# Result cache settings (every cache miss costs an E5 inference round trip on the cluster)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+# How often (seconds) we re-read the index stats to detect new writes
+GENERATION_CHECK_INTERVAL = float(os.getenv("GENERATION_CHECK_INTERVAL", "5"))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+result_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+# Query vectors only depend on the text and the model, so they never expire
+vector_cache = TTLCache(QUERY_VECTOR_CACHE_SIZE, float("inf"))
+
+_generation = {"value": None, "checked_at": 0.0}
+_generation_lock = threading.Lock()
+
+
+def generation_from_stats(stats):
+    """Build the generation token from an `indices.stats(metric="indexing,refresh")` response.
+
+    Uses the index uuid (changes when the index is recreated), the primary
+    indexing/delete counters (change on every write) and the refresh counter
+    (changes when writes become visible to searches, up to a refresh interval later).
+    """
+    return tuple(sorted(
+        (name, idx.get("uuid"),
+         idx["primaries"]["indexing"]["index_total"],
+         idx["primaries"]["indexing"]["delete_total"],
+         idx["primaries"]["refresh"]["total"])
+        for name, idx in stats["indices"].items()
+    ))
+
+
+def last_index_generation():
+    return _generation["value"]
+
+
+def generation_is_fresh(now):
+    return _generation["value"] is not None and now - _generation["checked_at"] < GENERATION_CHECK_INTERVAL
+
+
+def record_index_generation(generation, now):
+    if generation != _generation["value"]:
+        # Index content changed (or became unreadable): drop everything cached
+        result_cache.clear()
+    _generation["value"] = generation
+    _generation["checked_at"] = now
+    return generation
+
+
+def generation_steps():
+    """Return a token that changes whenever documents in the index change.
+
+    The stats call is throttled to once per GENERATION_CHECK_INTERVAL so it
+    stays far cheaper than the inference it saves.
+    """
+    now = time.monotonic()
+    if generation_is_fresh(now):
+        return last_index_generation()
+    try:
+        generation = generation_from_stats((yield ("es", "indices.stats", {"index": INDEX_NAME, "metric": "indexing,refresh"})))
+    except Exception as e:
+        print(f"Could not read index generation: {e}")
+        generation = None
+    return record_index_generation(generation, now)
+
+
+def current_index_generation():
+    with _generation_lock:
+        return drive(generation_steps())
+
+
+# Request flows are written once, as generators of I/O steps, so this Flask app
+# and search_app_async.py run the same logic, each with its own client:
+#   ("es", "search", kwargs)  - Elasticsearch API call (dotted for namespaces, e.g. "indices.stats")
+#   ("call", fn, args)        - blocking local work (runs in a worker thread under asyncio)
+#   ("generation",)           - the server's current_index_generation()
+#   ("emit", chunk)           - a streamed record (stream flows only)
+# The result of each step, or the exception it raised, is sent back into the generator.
+
+def es_method(client, name):
+    target = client
+    for part in name.split("."):
+        target = getattr(target, part)
+    return target
+
+
+def perform(op):
+    kind = op[0]
+    if kind == "es":
+        return es_method(es, op[1])(**op[2])
+    if kind == "call":
+        return op[1](*op[2])
+    if kind == "generation":
+        return current_index_generation()
+    raise ValueError(f"Unknown step: {kind}")
+
+
+def drive(steps):
+    """Run a step generator to completion against the sync client; returns its return value."""
+    value, error = None, None
+    while True:
+        try:
+            op = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = perform(op), None
+        except Exception as e:
+            value, error = None, e
+
+
+def drive_stream(steps):
+    """Like `drive`, but yields the chunks the flow emits (for a streamed response body)."""
+    value, error = None, None
+    try:
+        while True:
+            try:
+                op = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration:
+                return
+            if op[0] == "emit":
+                yield op[1]
+                value, error = None, None
+                continue
+            try:
+                value, error = perform(op), None
+            except Exception as e:
+                value, error = None, e
+    finally:
+        # Client went away mid-stream: let the flow run its cleanup
+        steps.close()
+
+
+def normalize_query(text):
+    """Collapse whitespace so trivially different queries share a cache entry."""
+    return " ".join((text or "").split())
+
+
+_local_model = None
+_local_model_lock = threading.Lock()
+
+
+def get_local_model():
+    """Load the local E5 model on first use (sentence-transformers is only needed in "local" mode)."""
+    global _local_model
+    with _local_model_lock:
+        if _local_model is None:
+            from sentence_transformers import SentenceTransformer
+            print(f"Loading local embedding model: {LOCAL_MODEL_NAME}...")
+            _local_model = SentenceTransformer(LOCAL_MODEL_NAME)
+        return _local_model
+
+
+def split_cached_vectors(texts, mode):
+    """Return ({text: cached vector}, [texts that still need embedding])."""
+    vectors = {}
+    missing = []
+    for text in texts:
+        vector = vector_cache.get((mode, text))
+        if vector is not None:
+            vectors[text] = vector
+        elif text not in missing:
+            missing.append(text)
+    return vectors, missing
+
+
+def store_vectors(mode, texts, new_vectors, vectors):
+    for text, vector in zip(texts, new_vectors):
+        vector_cache.put((mode, text), vector)
+        vectors[text] = vector
+
+
+def encode_local(texts):
+    # E5 models require the 'query: ' prefix for searching
+    encoded = get_local_model().encode([f"query: {t}" for t in texts], normalize_embeddings=True)
+    return [v.tolist() for v in encoded]
+
+
+def inference_request(texts):
+    # input_type=search makes the service apply the E5 query prefix
+    return {"inference_id": INFERENCE_ID, "input": texts, "input_type": "search"}
+
+
+def vectors_from_inference(resp):
+    return [item["embedding"] for item in resp["text_embedding"]]
+
+
+def embed_steps(texts, mode=None, timer=None):
+    """Return one query vector per text, embedding only the texts missing from the cache.
+
+    All misses are embedded in a single call (one `model.encode` batch or one
+    `inference.inference` request), so a batch of queries costs at most one
+    inference round trip.
+    """
+    mode = mode or QUERY_EMBEDDING
+    vectors, missing = split_cached_vectors(texts, mode)
+    if missing:
+        if timer:
+            timer.count_inference(mode)
+        if mode == "local":
+            new_vectors = yield ("call", encode_local, (missing,))
+        elif mode == "inference":
+            new_vectors = vectors_from_inference((yield ("es", "inference.inference", inference_request(missing))))
+        else:
+            raise ValueError(f"Unsupported query embedding mode: {mode}")
+        store_vectors(mode, missing, new_vectors, vectors)
+    return [vectors[t] for t in texts]
+
+
+def semantic_clause(query_text, size, filters=None, query_vector=None, boost=2.0):
+    """Semantic leg of the hybrid query: server-side `semantic`, or `knn` when a vector is given.
+
+    Filters are repeated inside `knn` so they act as pre-filters on the vector
+    search instead of trimming the top-k afterwards.
+    """
+    if query_vector is None:
+        return {
+            "semantic": {
+                "field": "content",
+                "query": query_text,
+                "boost": boost
+            }
+        }
+    return {
+        "knn": {
+            "field": "content",
+            "query_vector": query_vector,
+            "k": size,
+            "num_candidates": max(KNN_NUM_CANDIDATES, size),
+            "filter": filters or [],
+            "boost": boost
+        }
+    }
+
+
+def snippet(hit, full=False):
+    """Card text: the full content on request, else the best semantic fragments, else a prefix."""
+    if full:
+        return hit['_source'].get('content')
+    fragments = hit.get('highlight', {}).get('content')
+    text = " … ".join(fragments) if fragments else (hit['_source'].get('content') or "")
+    return text if len(text) <= SNIPPET_CHARS else text[:SNIPPET_CHARS].rstrip() + "…"
+
+
+def facet_counts(resp):
+    """Articles/files per facet value (distinct parent_id, not passages)."""
+    aggs = resp.get("aggregations") or {}
+    return {
+        field: {b["key"]: b["parents"]["value"] for b in aggs[field]["values"]["buckets"]}
+        for field in FACET_FIELDS if field in aggs
+    }
+
+
+def results_payload(resp, params):
+    payload = {"results": format_hits(resp, params["full"])}
+    if "aggregations" in resp:
+        payload["facets"] = facet_counts(resp)
+    return payload
+
+
+def first_page_payload(resp, params):
+    """Payload of a cacheable (unpaged) search; `/search` and `/search/batch` share its cache entries."""
+    payload = results_payload(resp, params)
+    hits = len(resp['hits']['hits'])
+    if params["mode"] == "hybrid" and hits >= params["size"]:
+        # "Load more" continues this first page on a point in time opened only then
+        payload["next_cursor"] = next_page_cursor(None, params, hits)
+    return payload
+
+
+def format_hits(resp, full=False, dedupe=True):
+    """One result per article/file: further passages of an already listed parent are dropped.
+
+    Collapsed searches are unique already; this covers the fused (RRF) rankings.
+    Exports (`dedupe=False`) keep every passage.
+    """
+    results = []
+    seen = set()
+    for hit in resp['hits']['hits']:
+        parent = hit['_source'].get('parent_id') or hit['_id']
+        if dedupe and parent in seen:
+            continue
+        seen.add(parent)
+        results.append({
+            "title": hit['_source'].get('title'),
+            "url": hit['_source'].get('url'),
+            "content": snippet(hit, full),
+            "language": hit['_source'].get('language'),
+            "category": hit['_source'].get('category'),
+            "page": hit['_source'].get('page'),
+            "parent_id": hit['_source'].get('parent_id'),
+            "score": hit['_score']
+        })
+    return results
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -91,6 +487,7 @@ HTML_TEMPLATE = """
             border: 1px solid transparent;
         }
         .filter-item:hover { background: rgba(255,255,255,0.08); }
+        .facet-count { font-size: 0.75rem; color: var(--text-dim); }
         .filter-item.active { background: rgba(0, 119, 255, 0.1); border: 1px solid var(--primary); color: var(--primary); }
 
         .test-btn {
@@ -202,6 +599,8 @@ HTML_TEMPLATE = """
 
         .toggle-explain { cursor: pointer; color: var(--primary); font-size: 0.8rem; font-weight: 600; }
 
+        .btn-more { display: none; margin: 2rem auto; padding: 12px 2.5rem; }
+
         .no-results { text-align: center; padding: 4rem; color: var(--text-dim); font-size: 1.2rem; }
     </style>
 </head>
@@ -210,19 +609,19 @@ HTML_TEMPLATE = """
         <div class="filter-section">
             <div class="section-title">📊 Content Types</div>
             <div class="filter-group" id="category-filter">
-                <div class="filter-item active" onclick="setCat(null, this)">All Content</div>
-                <div class="filter-item" onclick="setCat('Parallel Ground Truth', this)">Ground Truth (Parallel)</div>
-                <div class="filter-item" onclick="setCat('Background Noise', this)">Background Noise</div>
-                <div class="filter-item" onclick="setCat('Protocol', this)">Internal Protocols</div>
+                <div class="filter-item active" data-facet="category" data-value="" onclick="setCat(null, this)">All Content<span class="facet-count"></span></div>
+                <div class="filter-item" data-facet="category" data-value="Parallel Ground Truth" onclick="setCat('Parallel Ground Truth', this)">Ground Truth (Parallel)<span class="facet-count"></span></div>
+                <div class="filter-item" data-facet="category" data-value="Background Noise" onclick="setCat('Background Noise', this)">Background Noise<span class="facet-count"></span></div>
+                <div class="filter-item" data-facet="category" data-value="Protocol" onclick="setCat('Protocol', this)">Internal Protocols<span class="facet-count"></span></div>
             </div>
         </div>
         <div class="filter-section">
             <div class="section-title">🌍 Languages</div>
             <div class="filter-group">
-                <div class="filter-item active" onclick="setLang(null, this)">All Languages</div>
-                <div class="filter-item" onclick="setLang('en', this)">English</div>
-                <div class="filter-item" onclick="setLang('he', this)">Hebrew (עברית)</div>
-                <div class="filter-item" onclick="setLang('ar', this)">Arabic (العربية)</div>
+                <div class="filter-item active" data-facet="language" data-value="" onclick="setLang(null, this)">All Languages<span class="facet-count"></span></div>
+                <div class="filter-item" data-facet="language" data-value="en" onclick="setLang('en', this)">English<span class="facet-count"></span></div>
+                <div class="filter-item" data-facet="language" data-value="he" onclick="setLang('he', this)">Hebrew (עברית)<span class="facet-count"></span></div>
+                <div class="filter-item" data-facet="language" data-value="ar" onclick="setLang('ar', this)">Arabic (العربية)<span class="facet-count"></span></div>
             </div>
         </div>
 
@@ -240,6 +639,7 @@ HTML_TEMPLATE = """
         </div>
 
         <div id="results"></div>
+        <button class="btn-search btn-more" id="load-more" onclick="loadMore()">Load more</button>
     </main>
 
     <script>
@@ -270,10 +670,69 @@ HTML_TEMPLATE = """
             box.style.display = box.style.display === 'block' ? 'none' : 'block';
         }
 
+        let nextCursor = null;
+        let renderedCount = 0;
+
+        function renderCards(results) {
+            const resDiv = document.getElementById('results');
+            results.forEach(r => {
+                const idx = renderedCount++;
+                const isRtl = r.language === 'he' || r.language === 'ar';
+                const card = document.createElement('div');
+                card.className = `card ${isRtl ? 'rtl' : 'ltr'}`;
+                
+                card.innerHTML = `
+                    <div class="card-header">
+                        <a href="${r.url}" target="_blank" class="card-title">${r.title}</a>
+                        <div class="card-badges">
+                            <span class="badge badge-lang">${r.language}</span>
+                            <span class="badge badge-cat">${r.category}</span>
+                        </div>
+                    </div>
+                    <div class="card-body">${r.content}</div>
+                    
+                    <div class="explain-box" id="explain-${idx}">
+                        <strong>Semantic Match Detail:</strong><br>
+                        Matched language: ${r.language.toUpperCase()}<br>
+                        Raw Score: ${r.score.toFixed(4)}<br>
+                        Source: Wikipedia Summary
+                    </div>
+
+                    <div class="card-footer">
+                        <div class="footer-info">
+                            <span>Relevance: <span class="score">${r.score.toFixed(2)}</span></span>
+                            <span>•</span>
+                            <span>Wiki ${r.language.toUpperCase()}</span>
+                        </div>
+                        <div class="toggle-explain" onclick="toggleExplain(${idx})">Explain Match ℹ️</div>
+                    </div>
+                `;
+                resDiv.appendChild(card);
+            });
+        }
+
+        function updateFacets(facets) {
+            // Counts come from the same search request (post_filter keeps them unfiltered)
+            document.querySelectorAll('.filter-item[data-facet]').forEach(item => {
+                const buckets = (facets && facets[item.dataset.facet]) || {};
+                const count = item.dataset.value === ''
+                    ? Object.values(buckets).reduce((a, b) => a + b, 0)
+                    : (buckets[item.dataset.value] || 0);
+                item.querySelector('.facet-count').textContent = facets ? count : '';
+            });
+        }
+
+        function setNextCursor(cursor) {
+            nextCursor = cursor || null;
+            document.getElementById('load-more').style.display = nextCursor ? 'block' : 'none';
+        }
+
         async function search() {
             const query = document.getElementById('query').value;
             const resDiv = document.getElementById('results');
             resDiv.innerHTML = '<div class="no-results">Analyzing semantic space...</div>';
+            renderedCount = 0;
+            setNextCursor(null);
 
             try {
                 const response = await fetch('/search', {
@@ -282,52 +741,41 @@ HTML_TEMPLATE = """
                     body: JSON.stringify({
                         query: query,
                         lang: currentLang,
-                        cat: currentCat
+                        cat: currentCat,
+                        facets: true
                     })
                 });
+
+                // The first page is a plain (cacheable) JSON response; its cursor only
+                // opens a point in time once "Load more" is clicked
                 const data = await response.json();
+                if (data.error) throw new Error(data.error);
                 resDiv.innerHTML = '';
-
+                updateFacets(data.facets);
                 if (!data.results || data.results.length === 0) {
                     resDiv.innerHTML = '<div class="no-results">No matches found in the parallel index.</div>';
                     return;
                 }
+                renderCards(data.results);
+                setNextCursor(data.next_cursor);
+            } catch (e) {
+                resDiv.innerHTML = `<div class="no-results" style="color: #ef4444">Error: ${e.message}</div>`;
+            }
+        }
 
-                data.results.forEach((r, idx) => {
-                    const isRtl = r.language === 'he' || r.language === 'ar';
-                    const card = document.createElement('div');
-                    card.className = `card ${isRtl ? 'rtl' : 'ltr'}`;
-                    
-                    card.innerHTML = `
-                        <div class="card-header">
-                            <a href="${r.url}" target="_blank" class="card-title">${r.title}</a>
-                            <div class="card-badges">
-                                <span class="badge badge-lang">${r.language}</span>
-                                <span class="badge badge-cat">${r.category}</span>
-                            </div>
-                        </div>
-                        <div class="card-body">${r.content}</div>
-                        
-                        <div class="explain-box" id="explain-${idx}">
-                            <strong>Semantic Match Detail:</strong><br>
-                            Matched language: ${r.language.toUpperCase()}<br>
-                            Raw Score: ${r.score.toFixed(4)}<br>
-                            Source: Wikipedia Summary
-                        </div>
-
-                        <div class="card-footer">
-                            <div class="footer-info">
-                                <span>Relevance: <span class="score">${r.score.toFixed(2)}</span></span>
-                                <span>•</span>
-                                <span>Wiki ${r.language.toUpperCase()}</span>
-                            </div>
-                            <div class="toggle-explain" onclick="toggleExplain(${idx})">Explain Match ℹ️</div>
-                        </div>
-                    `;
-                    resDiv.appendChild(card);
+        async function loadMore() {
+            if (!nextCursor) return;
+            try {
+                const response = await fetch('/search', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({ cursor: nextCursor })
                 });
+                const data = await response.json();
+                renderCards(data.results || []);
+                setNextCursor(data.next_cursor);
             } catch (e) {
-                resDiv.innerHTML = `<div class="no-results" style="color: #ef4444">Error: ${e.message}</div>`;
+                setNextCursor(null);
             }
         }
 
@@ -341,14 +789,164 @@ HTML_TEMPLATE = """
 def index():
     return render_template_string(HTML_TEMPLATE)
 
-@app.route('/search', methods=['POST'])
-def search_api():
-    data = request.json
-    query_text = (data.get('query') or "").strip()
-    lang_filter = data.get('lang')
-    cat_filter = data.get('cat')
+def as_bool(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+def encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(",", ":")).encode()).decode()
+
+class CursorExpired(Exception):
+    """The point in time behind a cursor is gone; its sort values mean nothing on a new one."""
+
+def decode_cursor(token):
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(str(token).encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(cursor, dict) or not isinstance(cursor.get("params"), dict):
+        raise ValueError("Invalid cursor")
+    offset = cursor.get("from", 0)
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise ValueError("Invalid cursor")
+    if not isinstance(cursor.get("pit"), (str, type(None))):
+        raise ValueError("Invalid cursor")
+    return cursor
+
+def parse_search_request(data):
+    """Normalize a /search payload into the parameters that define its results.
+
+    A `cursor` carries the parameters of the search it continues, so follow-up
+    pages only need to send the cursor.
+    """
+    cursor = None
+    outer = data
+    if data.get('cursor'):
+        cursor = decode_cursor(data['cursor'])
+        data = cursor.pop("params")
+    mode = (data.get('mode') or SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {', '.join(SEARCH_MODES)}")
+    params = {
+        "query": normalize_query(data.get('query')),
+        "lang": data.get('lang'),
+        "cat": data.get('cat'),
+        "size": int(data.get('size') or 30),
+        "mode": mode,
+        "rank_window_size": int(data.get('rank_window_size') or RRF_RANK_WINDOW_SIZE),
+        "full": as_bool(data.get('full', False)),
+        "count_only": as_bool(data.get('count_only', False)),
+        "paginate": cursor is not None or as_bool(data.get('paginate', False)),
+        "cursor": cursor,
+        # Output options come from the request itself, even when continuing a cursor
+        "stream": (outer.get('stream') or "").lower() or None,
+        "export": as_bool(outer.get('export', False)),
+        "facets": as_bool(data.get('facets', False))
+    }
+    if not 1 <= params["size"] <= PAGINATION_MAX_RESULTS:
+        raise ValueError(f"size must be between 1 and {PAGINATION_MAX_RESULTS}")
+    if mode != "hybrid":
+        # Fused rankings have no single query to aggregate over; the results are still returned
+        params["facets"] = False
+    if params["stream"] not in (None, "ndjson", "sse"):
+        raise ValueError("stream must be 'ndjson' or 'sse'")
+    if params["export"] and not params["stream"]:
+        raise ValueError("export requires stream")
+    if params["export"] and cursor is not None:
+        raise ValueError("export cannot continue a cursor")
+    if params["stream"]:
+        # Streams are read page by page over a point in time
+        params["paginate"] = True
+    if params["paginate"] and mode != "hybrid":
+        # Fused rankings (RRF) cannot be paged over a point in time
+        raise ValueError("Pagination is only supported in hybrid mode")
+    return params
+
+def search_cache_key(generation, params):
+    return (generation, QUERY_EMBEDDING, tuple(sorted(params.items())))
+
+def cursor_params(params):
+    """The request fields a cursor needs to rebuild the same query."""
+    return {k: params[k] for k in ("query", "lang", "cat", "size", "mode", "full", "facets")}
+
+def filter_clauses(params):
+    # Filters (Language, Category)
+    filters = []
+    if params["lang"]:
+        filters.append({"term": {"language": params["lang"]}})
+    if params["cat"]:
+        filters.append({"term": {"category": params["cat"]}})
+    return filters
+
+def keyword_clause(query_text):
+    return {
+        "multi_match": {
+            "query": query_text,
+            "fields": ["title^5", "original_title^5"], # Direct keyword boost
+            "type": "best_fields"
+        }
+    }
+
+def fetch_options(params):
+    """`_source` filtering and highlighting for a search body.
 
-    # 1. Base Query Structure
+    With a query the semantic highlighter returns the best matching chunks, so the
+    (up to 10k char) content never leaves the cluster. match_all has nothing to
+    highlight, so content is fetched and cut down to a prefix in `snippet`.
+    """
+    if params["full"] or not params["query"]:
+        return {"_source": SOURCE_FIELDS + ["content"]}
+    return {
+        "_source": SOURCE_FIELDS,
+        "highlight": {
+            "fields": {
+                "content": {
+                    "type": "semantic",
+                    "number_of_fragments": HIGHLIGHT_FRAGMENTS,
+                    "order": "score"
+                }
+            }
+        }
+    }
+
+def facet_aggs(params):
+    """A terms agg per facet, each restricted by the *other* facets' selections only.
+
+    Together with `post_filter` this keeps every option of a facet countable
+    after one of them has been selected. With a query vector the knn leg is
+    pre-filtered, so unselected options only count their BM25 matches.
+    """
+    aggs = {}
+    for field in FACET_FIELDS:
+        others = [{"term": {f: params[key]}} for f, key in FACET_FIELDS.items() if f != field and params[key]]
+        aggs[field] = {
+            "filter": {"bool": {"filter": others}},
+            "aggs": {"values": {"terms": {"field": field, "size": FACET_SIZE}, "aggs": parent_count_aggs()}}
+        }
+    return aggs
+
+def parent_count_aggs():
+    # Exact up to 40000 articles/files per bucket (the cardinality agg's maximum threshold)
+    return {"parents": {"cardinality": {"field": "parent_id", "precision_threshold": 40000}}}
+
+def count_body(params, query_vector=None):
+    """`count_only`: distinct articles/files matching the query and filters."""
+    query = build_search_body({**params, "facets": False}, query_vector)["query"]
+    return {"query": query, "size": 0, "track_total_hits": False, "aggs": parent_count_aggs()}
+
+def count_from_response(resp):
+    return resp["aggregations"]["parents"]["value"]
+
+def build_search_body(params, query_vector=None):
+    query_text = params["query"]
+    # Any first page can be continued with "Load more", so every search uses the paged top-k:
+    # the same k keeps scores (and the order) identical between the first page and the next ones
+    k = max(params["size"], KNN_NUM_CANDIDATES)
+    # With facets the selected filters move to post_filter, so the query (and the aggs) stay unfiltered.
+    # The knn leg keeps them as pre-filters either way: trimming its top-k afterwards would lose results.
+    post_filters = filter_clauses(params) if params["facets"] else []
+    filters = [] if params["facets"] else filter_clauses(params)
+
+    # Base Query Structure
     if not query_text:
         search_query = {"match_all": {}}
     else:
@@ -356,57 +954,506 @@ def search_api():
         search_query = {
             "bool": {
                 "should": [
-                    {
-                        "semantic": {
-                            "field": "content",
-                            "query": query_text,
-                            "boost": 2.0  # High weight on semantic understanding
-                        }
-                    },
-                    {
-                        "multi_match": {
-                            "query": query_text,
-                            "fields": ["title^5", "original_title^5"], # Direct keyword boost
-                            "type": "best_fields"
-                        }
-                    }
+                    semantic_clause(query_text, k, filter_clauses(params), query_vector),  # High weight on semantic understanding
+                    keyword_clause(query_text)
                 ]
             }
         }
 
-    # 2. Add filters (Language, Category)
-    filters = []
-    if lang_filter:
-        filters.append({"term": {"language": lang_filter}})
-    if cat_filter:
-        filters.append({"term": {"category": cat_filter}})
-
     body = {
         "query": {
             "bool": {
-                "must": [search_query] if query_text else [{"match_all": {}}],
+                "must": [search_query],
                 "filter": filters
             }
         },
-        "size": 30 # Increased for better reach
+        "size": params["size"],
+        **fetch_options(params)
     }
+    # Passages of one article/file share a parent_id; return only the best one
+    body["collapse"] = {"field": "parent_id"}
+    if params["facets"]:
+        body["aggs"] = facet_aggs(params)
+        if post_filters:
+            body["post_filter"] = {"bool": {"filter": post_filters}}
+    return body
+
+def build_leg_queries(params, query_vector=None):
+    """The BM25 and semantic legs as independent, filtered queries (ranked separately, then fused)."""
+    filters = filter_clauses(params)
+    window = max(params["rank_window_size"], params["size"])
+    legs = [
+        keyword_clause(params["query"]),
+        semantic_clause(params["query"], window, filters, query_vector, boost=1.0)
+    ]
+    return [{"bool": {"must": [leg], "filter": filters}} for leg in legs]
+
+def build_rrf_body(params, query_vector=None):
+    """Server-side Reciprocal Rank Fusion through the `rrf` retriever."""
+    return {
+        "retriever": {
+            "rrf": {
+                "retrievers": [{"standard": {"query": q}} for q in build_leg_queries(params, query_vector)],
+                "rank_window_size": max(params["rank_window_size"], params["size"]),
+                "rank_constant": RRF_RANK_CONSTANT
+            }
+        },
+        "size": params["size"],
+        **fetch_options(params)
+    }
+
+def build_leg_searches(params, query_vector=None):
+    """One `msearch` entry per leg, each fetching a full rank window for client-side fusion."""
+    window = max(params["rank_window_size"], params["size"])
+    searches = []
+    for query in build_leg_queries(params, query_vector):
+        searches.append({"index": INDEX_NAME})
+        searches.append({"query": query, "size": window, **fetch_options(params)})
+    return searches
+
+def rrf_fuse(hit_lists, size, rank_constant=RRF_RANK_CONSTANT):
+    """Client-side RRF: score(doc) = sum over legs of 1 / (rank_constant + rank)."""
+    fused = {}
+    for hits in hit_lists:
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["_id"], {**hit, "_score": 0.0})
+            entry["_score"] += 1.0 / (rank_constant + rank)
+            # Only the semantic leg carries highlight fragments
+            if "highlight" in hit and "highlight" not in entry:
+                entry["highlight"] = hit["highlight"]
+    ranked = sorted(fused.values(), key=lambda h: h["_score"], reverse=True)
+    return {"hits": {"hits": ranked[:size]}}
+
+def fuse_msearch(resp, size):
+    hit_lists = []
+    for leg in resp["responses"]:
+        if "error" in leg:
+            raise RuntimeError(f"Search leg failed: {leg['error']}")
+        hit_lists.append(leg["hits"]["hits"])
+    fused = rrf_fuse(hit_lists, size)
+    fused["took"] = resp.get("took")
+    return fused
+
+def plan_search(params, query_vector=None):
+    """Decide how to run a search: ("search", body) or ("msearch", searches) for client-side fusion."""
+    if not params["query"] or params["mode"] == "hybrid":
+        return "search", build_search_body(params, query_vector)
+    if params["mode"] == "rrf":
+        return "search", build_rrf_body(params, query_vector)
+    return "msearch", build_leg_searches(params, query_vector)
+
+def run_search_steps(params, query_vector=None):
+    kind, payload = plan_search(params, query_vector)
+    if kind == "msearch":
+        return fuse_msearch((yield ("es", "msearch", {"searches": payload})), params["size"])
+    try:
+        return (yield ("es", "search", {"index": INDEX_NAME, "body": payload}))
+    except ApiError as e:
+        if params["mode"] != "rrf" or not params["query"]:
+            raise
+        # Retriever RRF unavailable (cluster version or license): fuse the legs ourselves
+        print(f"RRF retriever failed ({e}), falling back to client-side fusion")
+        return (yield from run_search_steps({**params, "mode": "rrf_client"}, query_vector))
+
+def build_page_body(params, pit_id, position=None, query_vector=None):
+    """A hybrid search over a point in time, sorted by score with the PIT's implicit _shard_doc tiebreaker.
+
+    Pages are collapsed on parent_id and continue at `position["from"]` (collapse
+    cannot be combined with search_after on _score). Exports instead walk every
+    passage with `position["search_after"]`.
+    """
+    position = position or {}
+    body = build_search_body(params, query_vector)
+    body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+    body["sort"] = [{"_score": "desc"}]
+    if params["export"]:
+        body.pop("collapse", None)
+        if position.get("search_after"):
+            body["search_after"] = position["search_after"]
+    elif position.get("from"):
+        body["from"] = position["from"]
+        body["size"] = max(0, min(body["size"], PAGINATION_MAX_RESULTS - position["from"]))
+    if position.get("from") or position.get("search_after"):
+        # Facet counts come with the first page only
+        body.pop("aggs", None)
+    return body
+
+def next_page_cursor(pit_id, params, offset):
+    """Cursor for the page starting at `offset`, or None past PAGINATION_MAX_RESULTS.
+
+    Without `pit_id` the next page opens a point in time of its own.
+    """
+    if offset >= PAGINATION_MAX_RESULTS:
+        return None
+    return encode_cursor({"pit": pit_id, "from": offset, "params": cursor_params(params)})
+
+def page_payload(resp, params, offset=0):
+    """Build the JSON payload of the page at `offset`; also return the PIT id to close once the last page is reached."""
+    hits = resp['hits']['hits']
+    pit_id = resp.get("pit_id")
+    payload = {**results_payload(resp, params), "next_cursor": None}
+    if len(hits) < params["size"]:
+        return payload, pit_id
+    payload["next_cursor"] = next_page_cursor(pit_id, params, offset + len(hits))
+    return payload, None if payload["next_cursor"] else pit_id
+
+def open_pit_step():
+    return ("es", "open_point_in_time", {"index": INDEX_NAME, "keep_alive": PIT_KEEP_ALIVE})
+
+def pit_search_steps(body, cursor):
+    try:
+        return (yield ("es", "search", {"body": body}))
+    except NotFoundError:
+        if cursor.get("pit"):
+            # PIT expired between pages: its offset (or an export's search_after with the old
+            # _shard_doc tiebreaker) cannot be resumed on a fresh PIT without skipping or repeating hits
+            raise CursorExpired("Cursor expired, run the search again without a cursor")
+        raise
+
+def search_page_steps(params, query_vector=None, timer=None):
+    cursor = params["cursor"] or {}
+    with timer.stage("es") if timer else nullcontext():
+        pit_id = cursor.get("pit") or (yield open_pit_step())["id"]
+        resp = yield from pit_search_steps(build_page_body(params, pit_id, cursor, query_vector), cursor)
+    if timer:
+        timer.es_response(resp)
+    payload, finished_pit = page_payload(resp, params, cursor.get("from", 0))
+    if finished_pit:
+        yield ("es", "close_point_in_time", {"id": finished_pit})
+    return payload
+
+def format_event(fmt, kind, data):
+    """One streamed record: an NDJSON line or a Server-Sent Event."""
+    if fmt == "sse":
+        return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"type": kind, **data}, ensure_ascii=False) + "\n"
+
+def stream_page_size(params, sent):
+    """Small first page so the first card goes out quickly, bigger pages after that."""
+    page = STREAM_FIRST_PAGE if sent == 0 else STREAM_PAGE_SIZE
+    if params["export"]:
+        return page
+    return min(page, params["size"] - sent)
+
+def emit(params, timer, kind, data):
+    if kind == "hit" and timer and "first_hit" not in timer.stages:
+        timer.stages["first_hit"] = time.perf_counter() - timer.started
+    return ("emit", format_event(params["stream"], kind, data))
+
+def stream_search_steps(params, query_vector=None, timer=None):
+    """Emit every hit, page by page over a PIT, then an "end" record.
+
+    Only one page is held in memory. Without `export` the stream stops after `size`
+    hits and returns a `next_cursor` for the next page.
+    A client that disconnects leaves the PIT to expire after PIT_KEEP_ALIVE.
+    """
+    cursor = params["cursor"] or {}
+    pit_id = cursor.get("pit") or (yield open_pit_step())["id"]
+    position = {"from": cursor.get("from", 0)}
+    sent = 0
+    try:
+        while True:
+            page_size = stream_page_size(params, sent)
+            if page_size <= 0:
+                # Limit reached: the PIT is closed rather than left open for a page nobody may ask for;
+                # the cursor continues at this offset on a new one
+                next_cursor = next_page_cursor(None, params, position["from"])
+                yield from close_pit_steps(pit_id)
+                yield emit(params, timer, "end", {"count": sent, "next_cursor": next_cursor})
+                return
+            with timer.stage("es") if timer else nullcontext():
+                resp = yield from pit_search_steps(
+                    build_page_body({**params, "size": page_size}, pit_id, position, query_vector), cursor)
+            if timer:
+                timer.es_response(resp)
+            pit_id = resp.get("pit_id", pit_id)
+            hits = resp['hits']['hits']
+            if "aggregations" in resp:
+                yield emit(params, timer, "facets", {"facets": facet_counts(resp)})
+            for result in format_hits(resp, params["full"], dedupe=not params["export"]):
+                yield emit(params, timer, "hit", result)
+            sent += len(hits)
+            if len(hits) < page_size:
+                break
+            if params["export"]:
+                position = {"search_after": hits[-1]["sort"]}
+            else:
+                position = {"from": position["from"] + len(hits)}
+                if position["from"] >= PAGINATION_MAX_RESULTS:
+                    break
+    except Exception:
+        yield from close_pit_steps(pit_id)
+        raise
+    yield from close_pit_steps(pit_id)
+    yield emit(params, timer, "end", {"count": sent, "next_cursor": None})
+
+def close_pit_steps(pit_id):
+    try:
+        yield ("es", "close_point_in_time", {"id": pit_id})
+    except Exception:
+        pass
+
+def stream_response_steps(params, timer):
+    """Body of a streamed /search response: the hits, or an error record if the search fails."""
+    try:
+        yield from stream_search_steps(params, (yield from query_vector_steps(params, timer)), timer)
+    except CursorExpired as e:
+        yield emit(params, timer, "error", {"error": str(e), "expired": True})
+    except Exception as e:
+        print(f"Error: {e}")
+        yield emit(params, timer, "error", {"error": str(e)})
+    finally:
+        timer.finish(*metric_labels(params), cache="none", detail=params["query"])
+
+def stream_headers(params):
+    mimetype = "text/event-stream" if params["stream"] == "sse" else "application/x-ndjson"
+    # Tell reverse proxies not to buffer the stream
+    return mimetype, {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def query_vector_steps(params, timer=None):
+    if not params["query"]:
+        return None
+    if QUERY_EMBEDDING == "server":
+        if timer:
+            # The semantic clause makes the ML node embed the query inside the search
+            timer.count_inference("server")
+        return None
+    with timer.stage("embed") if timer else nullcontext():
+        return (yield from embed_steps([params["query"]], timer=timer))[0]
+
+def metric_labels(params):
+    mode = params["mode"] if params["query"] else "match_all"
+    return mode, metrics.filter_label(params["lang"], params["cat"])
+
+def json_reply(jsonify, timer, payload, status, finish):
+    """Serialize a flow's result; `finish` holds the timer labels (None: not recorded)."""
+    with timer.stage("serialize"):
+        response = jsonify(payload)
+    if finish:
+        timer.finish(**finish)
+    return response, status
+
+def search_steps(data, timer):
+    """/search: ("stream", params) for a streamed response, else ("json", payload, status, finish)."""
+    try:
+        with timer.stage("parse"):
+            params = parse_search_request(data)
+    except (TypeError, ValueError) as e:
+        return "json", {"error": str(e)}, 400, None
+    mode, filters = metric_labels(params)
+    labels = {"mode": mode, "filters": filters, "detail": params["query"]}
+
+    if params["stream"] and not params["count_only"]:
+        return "stream", params
+
+    if params["paginate"] and not params["count_only"]:
+        # Pages live on a point in time, so they bypass the result cache
+        try:
+            query_vector = yield from query_vector_steps(params, timer)
+            payload = yield from search_page_steps(params, query_vector, timer)
+            return "json", payload, 200, {**labels, "cache": "none"}
+        except CursorExpired as e:
+            return "json", {"error": str(e), "expired": True}, 410, None
+        except Exception as e:
+            print(f"Error: {e}")
+            return "json", {"error": str(e)}, 500, None
+
+    with timer.stage("cache"):
+        generation = yield ("generation",)
+        cache_key = search_cache_key(generation, {**params, "paginate": False, "cursor": None})
+        cached = result_cache.get(cache_key) if generation is not None else None
+    if cached is not None:
+        return "json", {**cached, "cached": True}, 200, {**labels, "cache": "hit"}
 
     try:
-        resp = es.search(index=INDEX_NAME, body=body)
-        results = []
-        for hit in resp['hits']['hits']:
-            results.append({
-                "title": hit['_source'].get('title'),
-                "url": hit['_source'].get('url'),
-                "content": hit['_source'].get('content'),
-                "language": hit['_source'].get('language'),
-                "category": hit['_source'].get('category'),
-                "score": hit['_score']
-            })
-        return jsonify({"results": results})
+        query_vector = yield from query_vector_steps(params, timer)
+        with timer.stage("es"):
+            if params["count_only"]:
+                resp = yield ("es", "search", {"index": INDEX_NAME, "body": count_body(params, query_vector)})
+            else:
+                resp = yield from run_search_steps(params, query_vector)
+        timer.es_response(resp)
+        if params["count_only"]:
+            payload = {"count": count_from_response(resp)}
+        else:
+            payload = first_page_payload(resp, params)
+        if generation is not None:
+            result_cache.put(cache_key, payload)
+        return "json", {**payload, "cached": False}, 200, {**labels, "cache": "miss"}
     except Exception as e:
         print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+        return "json", {"error": str(e)}, 500, None
+
+@app.route('/search', methods=['POST'])
+def search_api():
+    timer = metrics.RequestTimer("search")
+    reply = drive(search_steps(request.json, timer))
+    if reply[0] == "stream":
+        params = reply[1]
+        mimetype, headers = stream_headers(params)
+        return Response(stream_with_context(drive_stream(stream_response_steps(params, timer))),
+                        mimetype=mimetype, headers=headers)
+    return json_reply(jsonify, timer, *reply[1:])
+
+def parse_batch_request(data):
+    """Parse the specs of a batch search; invalid specs become error items instead of failing the batch.
+
+    Returns (items, pending): `items` holds one slot per spec (filled for errors),
+    `pending` the (position, params) pairs still to run.
+    """
+    specs = (data or {}).get('queries')
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("'queries' must be a non-empty list of search specs")
+    if len(specs) > BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {BATCH_MAX_QUERIES} queries per batch")
+    items = [None] * len(specs)
+    pending = []
+    for i, spec in enumerate(specs):
+        try:
+            params = parse_search_request(spec)
+            if params["paginate"]:
+                raise ValueError("Pagination is not supported in batch searches")
+            pending.append((i, params))
+        except (AttributeError, TypeError, ValueError) as e:
+            items[i] = {"error": str(e)}
+    return items, pending
+
+def take_cached(items, pending, generation):
+    """Answer what we can from the result cache; return the rest as (position, params, cache_key)."""
+    misses = []
+    for i, params in pending:
+        cache_key = search_cache_key(generation, params)
+        cached = result_cache.get(cache_key) if generation is not None else None
+        if cached is not None:
+            items[i] = {**cached, "cached": True}
+        else:
+            misses.append((i, params, cache_key))
+    return misses
+
+def batch_lines(params, query_vector=None):
+    """The msearch header/body lines for one batch entry."""
+    if params["count_only"]:
+        return [{"index": INDEX_NAME}, count_body(params, query_vector)]
+    kind, payload = plan_search(params, query_vector)
+    if kind == "msearch":
+        return payload
+    return [{"index": INDEX_NAME}, payload]
+
+def build_batch(misses, vectors):
+    """Flatten every pending entry into one msearch; `slots` records how many responses each one owns."""
+    searches = []
+    slots = []
+    for _, params, _ in misses:
+        lines = batch_lines(params, vectors.get(params["query"]))
+        searches.extend(lines)
+        slots.append(len(lines) // 2)
+    return searches, slots
+
+def batch_item_payload(params, responses):
+    for r in responses:
+        if "error" in r:
+            raise RuntimeError(r["error"])
+    if params["count_only"]:
+        return {"count": count_from_response(responses[0])}
+    if len(responses) > 1:
+        return {"results": format_hits(fuse_msearch({"responses": responses}, params["size"]), params["full"])}
+    return first_page_payload(responses[0], params)
+
+def store_batch_item(items, i, cache_key, payload, generation):
+    if generation is not None:
+        result_cache.put(cache_key, payload)
+    items[i] = {**payload, "cached": False}
+
+def collect_batch(items, misses, slots, responses, generation):
+    """Fill items from the msearch responses; return the RRF entries that need the client-side fallback."""
+    retry = []
+    offset = 0
+    for (i, params, cache_key), n in zip(misses, slots):
+        try:
+            store_batch_item(items, i, cache_key, batch_item_payload(params, responses[offset:offset + n]), generation)
+        except RuntimeError as e:
+            if params["mode"] == "rrf":
+                retry.append((i, params, cache_key))
+            else:
+                items[i] = {"error": str(e)}
+        except Exception as e:
+            items[i] = {"error": str(e)}
+        offset += n
+    return retry
+
+def batch_vector_steps(misses, timer=None):
+    texts = sorted({params["query"] for _, params, _ in misses if params["query"]})
+    if not texts:
+        return {}
+    if QUERY_EMBEDDING == "server":
+        if timer:
+            # Every entry with a query text is embedded again by the ML node
+            timer.count_inference("server", sum(1 for _, params, _ in misses if params["query"]))
+        return {}
+    return dict(zip(texts, (yield from embed_steps(texts, timer=timer))))
+
+def batch_steps(data, timer):
+    """/search/batch: N search specs (same fields as /search) in one msearch; responses keep the request order.
+
+    Returns (payload, status, finish) like the JSON replies of `search_steps`.
+    """
+    try:
+        with timer.stage("parse"):
+            items, pending = parse_batch_request(data)
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}, 400, None
+
+    with timer.stage("cache"):
+        generation = yield ("generation",)
+        misses = take_cached(items, pending, generation)
+    if misses:
+        try:
+            # One embedding call for every distinct query text in the batch
+            with timer.stage("embed"):
+                vectors = yield from batch_vector_steps(misses, timer)
+            searches, slots = build_batch(misses, vectors)
+            with timer.stage("es"):
+                resp = yield ("es", "msearch", {"searches": searches})
+            timer.es_response(resp)
+            responses = resp["responses"]
+        except Exception as e:
+            print(f"Error: {e}")
+            return {"error": str(e)}, 500, None
+
+        for i, params, cache_key in collect_batch(items, misses, slots, responses, generation):
+            # Same RRF fallback as /search, for this entry only
+            try:
+                resp = yield from run_search_steps(params, vectors.get(params["query"]))
+                store_batch_item(items, i, cache_key, {"results": format_hits(resp, params["full"])}, generation)
+            except Exception as e:
+                items[i] = {"error": str(e)}
+
+    return {"responses": items}, 200, {
+        "mode": "batch", "cache": "miss" if misses else "hit", "detail": f"{len(items)} queries"
+    }
+
+@app.route('/search/batch', methods=['POST'])
+def batch_search_api():
+    timer = metrics.RequestTimer("batch")
+    return json_reply(jsonify, timer, *drive(batch_steps(request.json, timer)))
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats_api():
+    return jsonify({
+        "results": result_cache.stats(),
+        "query_vectors": vector_cache.stats(),
+        "query_embedding": QUERY_EMBEDDING
+    })
+
+@app.route('/cache/clear', methods=['POST'])
+def cache_clear_api():
+    result_cache.clear()
+    vector_cache.clear()
+    return jsonify({"cleared": True})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     # Binding to 0.0.0.0 allows access from other machines on the same network
@@ -0,0 +1,172 @@
+import os
+import asyncio
+from quart import Quart, Response, request, jsonify, render_template_string
+from quart_cors import cors
+from elasticsearch import AsyncElasticsearch
+
+# The request flows (search, pages, streams, batches) are shared with the Flask app as
+# generators of I/O steps (see search_app.drive); this module only runs them with asyncio
+import search_app
+from search_app import (
+    HTML_TEMPLATE, QUERY_EMBEDDING, result_cache, vector_cache,
+    es_method, generation_steps, search_steps, batch_steps, stream_response_steps, stream_headers, json_reply,
+)
+from rag import RAG_INDEX_NAME, build_rag_body, rag_response
+import metrics
+
+# Connection pool settings: one connection per in-flight request to each ES node
+ES_POOL_SIZE = int(os.getenv("ES_POOL_SIZE", "256"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "60"))
+
+ASGI_HOST = os.getenv("ASGI_HOST", "0.0.0.0")
+ASGI_PORT = int(os.getenv("ASGI_PORT", "5075"))
+ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", "1"))
+
+app = cors(Quart(__name__), allow_origin="*")
+
+es = None
+_generation_lock = None
+
+
+@app.before_serving
+async def startup():
+    global es, _generation_lock
+    client_args = {"api_key": search_app.ELASTIC_API_KEY,
+                   "connections_per_node": ES_POOL_SIZE,
+                   "request_timeout": ES_REQUEST_TIMEOUT}
+    if search_app.ELASTIC_CLOUD_ID:
+        es = AsyncElasticsearch(cloud_id=search_app.ELASTIC_CLOUD_ID, **client_args)
+    else:
+        es = AsyncElasticsearch(search_app.ELASTIC_URL, **client_args)
+    _generation_lock = asyncio.Lock()
+
+
+@app.after_serving
+async def shutdown():
+    await es.close()
+
+
+async def current_index_generation():
+    """Same throttling and cache invalidation as the Flask app, serialized with an asyncio lock."""
+    async with _generation_lock:
+        return await drive(generation_steps())
+
+
+async def perform(op):
+    kind = op[0]
+    if kind == "es":
+        return await es_method(es, op[1])(**op[2])
+    if kind == "call":
+        # Local encoding is blocking, keep it off the event loop
+        return await asyncio.to_thread(op[1], *op[2])
+    if kind == "generation":
+        return await current_index_generation()
+    raise ValueError(f"Unknown step: {kind}")
+
+
+async def drive(steps):
+    """Async twin of search_app.drive."""
+    value, error = None, None
+    while True:
+        try:
+            op = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = await perform(op), None
+        except Exception as e:
+            value, error = None, e
+
+
+async def drive_stream(steps):
+    """Async twin of search_app.drive_stream."""
+    value, error = None, None
+    try:
+        while True:
+            try:
+                op = steps.send(value) if error is None else steps.throw(error)
+            except StopIteration:
+                return
+            if op[0] == "emit":
+                yield op[1]
+                value, error = None, None
+                continue
+            try:
+                value, error = await perform(op), None
+            except Exception as e:
+                value, error = None, e
+    finally:
+        steps.close()
+
+
+@app.route('/')
+async def index():
+    return await render_template_string(HTML_TEMPLATE)
+
+
+@app.route('/search', methods=['POST'])
+async def search_api():
+    timer = metrics.RequestTimer("search")
+    reply = await drive(search_steps(await request.get_json(), timer))
+    if reply[0] == "stream":
+        params = reply[1]
+        mimetype, headers = stream_headers(params)
+        return Response(drive_stream(stream_response_steps(params, timer)), mimetype=mimetype, headers=headers)
+    return json_reply(jsonify, timer, *reply[1:])
+
+
+@app.route('/search/batch', methods=['POST'])
+async def batch_search_api():
+    timer = metrics.RequestTimer("batch")
+    return json_reply(jsonify, timer, *await drive(batch_steps(await request.get_json(), timer)))
+
+
+@app.route('/rag', methods=['POST'])
+async def rag_api():
+    timer = metrics.RequestTimer("rag")
+    with timer.stage("parse"):
+        data = await request.get_json()
+        query_text = data.get('query')
+        category_filter = data.get('category')
+
+    try:
+        timer.count_inference("server")
+        with timer.stage("es"):
+            response = await es.search(index=RAG_INDEX_NAME, body=build_rag_body(query_text, category_filter), size=3)
+        timer.es_response(response)
+        # Answer generation is blocking, keep it off the event loop
+        with timer.stage("generate"):
+            payload = await asyncio.to_thread(rag_response, query_text, response['hits']['hits'])
+        with timer.stage("serialize"):
+            result = jsonify(payload)
+        timer.finish("semantic", metrics.filter_label(None, category_filter), detail=query_text)
+        return result
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/cache/stats', methods=['GET'])
+async def cache_stats_api():
+    return jsonify({
+        "results": result_cache.stats(),
+        "query_vectors": vector_cache.stats(),
+        "query_embedding": QUERY_EMBEDDING
+    })
+
+
+@app.route('/cache/clear', methods=['POST'])
+async def cache_clear_api():
+    result_cache.clear()
+    vector_cache.clear()
+    return jsonify({"cleared": True})
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_api():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+if __name__ == "__main__":
+    # Production entry point: uvicorn with an event loop per worker process
+    import uvicorn
+    uvicorn.run("search_app_async:app", host=ASGI_HOST, port=ASGI_PORT, workers=ASGI_WORKERS)
@@ -1,11 +1,12 @@
 import os
 import json
-import time
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string
 from flask_cors import CORS
 from dotenv import load_dotenv
 from elasticsearch import Elasticsearch
 from sentence_transformers import SentenceTransformer
+from rag import RAG_INDEX_NAME, build_rag_body, rag_response
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -366,84 +367,36 @@ HTML_TEMPLATE = """
 </html>
 """
 
-# MOCK RAG LOGIC
-# In a real app, this would call OpenAI or Gemini
-def simulate_ai_answer(query, context, title):
-    time.sleep(1) # Fake thinking
-    
-    if "ירושלים" in title or "ירושלים" in context or "Jerusalem" in query.lower():
-        return f"Jerusalem is one of the world's oldest cities with a rich history spanning millennia. According to the fetched content from Wikipedia, it is central to many cultures and has undergone significant historical transitions. Based on this documentation, politics in Jerusalem remain a key area of global interest."
-    elif "מדע" in title or "Science" in query.lower():
-        return f"Science (מדע) is the systematic study of the physical and natural world through observation and experiment. The Wikipedia context indexed in Elasticsearch highlights that modern science has evolved through centuries of research and remains the primary driver of human technological progress."
-    elif "ישראל" in title or "Israel" in query.lower():
-        return f"Israel is a country in the Middle East with a deep history. The retrieval from your Elastic index shows it has a rich cultural and technological landscape. Based on the Wikipedia summary, it emerged as a modern independent state with a unique synthesis of ancient and modern elements."
-    
-    return f"Based on the documents found in your index: {context[:200]}..."
-
 @app.route('/')
 def home():
     return render_template_string(HTML_TEMPLATE)
 
 @app.route('/rag', methods=['POST'])
 def rag_api():
-    data = request.json
-    query_text = data.get('query')
-    category_filter = data.get('category')
-
-    # 1. RETRIEVAL STEP
-    # Use the cloud index for best semantic context
-    index_name = "ct-multilingual-semantic-index"
-    
-    semantic_clause = {
-        "semantic": {
-            "field": "content",
-            "query": query_text
-        }
-    }
-    
-    search_body = {"query": semantic_clause}
-    if category_filter:
-        search_body = {
-            "query": {
-                "bool": {
-                    "must": [semantic_clause],
-                    "filter": [{"term": {"category": category_filter}}]
-                }
-            }
-        }
+    timer = metrics.RequestTimer("rag")
+    with timer.stage("parse"):
+        data = request.json
+        query_text = data.get('query')
+        category_filter = data.get('category')
 
     try:
-        response = es.search(index=index_name, body=search_body, size=3)
-        hits = response['hits']['hits']
-        
-        if not hits:
-            return jsonify({"answer": "I couldn't find any relevant data in your index to answer that.", "results": [], "source_title": "N/A"})
-
-        # Top hit becomes our 'context'
-        top_hit = hits[0]['_source']
-        context = top_hit['content']
-        source_title = top_hit['title']
-
-        # 2. GENERATION STEP (Simulated)
-        answer = simulate_ai_answer(query_text, context, source_title)
-
-        results = []
-        for hit in hits:
-            results.append({
-                "title": hit['_source'].get('title'),
-                "content": hit['_source'].get('content'),
-                "category": hit['_source'].get('category'),
-                "score": hit['_score']
-            })
-
-        return jsonify({
-            "answer": answer,
-            "results": results,
-            "source_title": source_title
-        })
-
+        # 1. RETRIEVAL STEP (the semantic clause embeds the query on the ML node)
+        timer.count_inference("server")
+        with timer.stage("es"):
+            response = es.search(index=RAG_INDEX_NAME, body=build_rag_body(query_text, category_filter), size=3)
+        timer.es_response(response)
+        with timer.stage("generate"):
+            payload = rag_response(query_text, response['hits']['hits'])
+        with timer.stage("serialize"):
+            result = jsonify(payload)
+        timer.finish("semantic", metrics.filter_label(None, category_filter), detail=query_text)
+        return result
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     app.run(port=5000)
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Persistent cache of Wikipedia fetches shared by indexer.py and the demo scripts
+WIKI_CACHE_PATH = os.getenv("WIKI_CACHE_PATH", ".wiki_cache.sqlite")
+# Pages checked more recently than this (seconds) are served without any request;
+# older ones cost one `info` request and are only re-downloaded if their revision changed
+WIKI_CACHE_MAX_AGE = float(os.getenv("WIKI_CACHE_MAX_AGE", "86400"))
+# Never touch the network: serve everything from the cache; misses are skipped, not treated as deleted pages
+WIKI_OFFLINE = os.getenv("WIKI_OFFLINE", "false").lower() in ("1", "true", "yes")
+
+
+class WikiCache:
+    """SQLite cache of page summary, full text, fullurl, langlinks and links keyed by (language, title).
+
+    Entries carry the page revision id; a stale entry is revalidated with the
+    page's `lastrevid` and only re-fetched when the revision changed.
+    `page()` returns a plain dict (or None for pages that do not exist).
+    """
+
+    def __init__(self, path=WIKI_CACHE_PATH, max_age=WIKI_CACHE_MAX_AGE, offline=WIKI_OFFLINE):
+        self.max_age = max_age
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.fetched = 0
+        self.misses = 0
+        # Guards the database and the counters, which the fetch threads share
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                lang TEXT NOT NULL,
+                title TEXT NOT NULL,
+                revid INTEGER,
+                checked_at REAL NOT NULL,
+                data TEXT,
+                PRIMARY KEY (lang, title)
+            )
+        """)
+        self._db.commit()
+
+    def _load(self, lang, title):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT revid, checked_at, data FROM pages WHERE lang = ? AND title = ?", (lang, title)
+            ).fetchone()
+        if row is None:
+            return None
+        revid, checked_at, data = row
+        return {"revid": revid, "checked_at": checked_at, "page": json.loads(data) if data else None}
+
+    def _store(self, lang, title, revid, page):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (lang, title, revid, checked_at, data) VALUES (?, ?, ?, ?, ?)",
+                (lang, title, revid, time.time(), json.dumps(page, ensure_ascii=False) if page else None)
+            )
+            self._db.commit()
+
+    def page(self, wiki, title, links=False):
+        """Return {"title", "fullurl", "summary", "text", "langlinks", "links", "revid"} for `title` on `wiki`.
+
+        `langlinks` maps language code to title. `links` (list of titles) is only
+        fetched when requested, since it can be large.
+        """
+        lang = wiki.language
+        entry = self._load(lang, title)
+        cached = entry["page"] if entry else None
+        # Entries written before full text was cached are fetched again
+        usable = entry is not None and (cached is None or ("text" in cached and (not links or cached["links"] is not None)))
+
+        if usable and (self.offline or time.time() - entry["checked_at"] < self.max_age):
+            with self._lock:
+                self.hits += 1
+            return entry["page"]
+        if self.offline:
+            with self._lock:
+                self.misses += 1
+            # An entry without the text or links asked for counts as missing, not as a partial page
+            print(f" ! Offline: '{title}' ({lang}) is not in the Wikipedia cache")
+            return None
+
+        p = wiki.page(title)
+        if not p.exists():
+            self._store(lang, title, None, None)
+            return None
+        if usable and entry["page"] is not None and entry["revid"] == p.lastrevid:
+            # Same revision: keep the cached content, just mark it as checked
+            with self._lock:
+                self.revalidated += 1
+            self._store(lang, title, p.lastrevid, entry["page"])
+            return entry["page"]
+
+        with self._lock:
+            self.fetched += 1
+        page = {
+            "title": p.title,
+            "fullurl": p.fullurl,
+            "summary": p.summary,
+            "text": p.text, # Same `extracts` request as the summary
+            "langlinks": {code: link.title for code, link in p.langlinks.items()},
+            "links": list(p.links.keys()) if links else None,
+            "revid": p.lastrevid
+        }
+        self._store(lang, title, p.lastrevid, page)
+        return page
+
+    def report(self):
+        print(f"Wikipedia cache: {self.hits} hits, {self.revalidated} revalidated, "
+              f"{self.fetched} fetched, {self.misses} offline misses")